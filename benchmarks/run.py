@@ -0,0 +1,269 @@
+"""
+Offline benchmarks for the scout pipeline.
+
+    python benchmarks/run.py                       # every benchmark with the default settings
+    python benchmarks/run.py scout --count 128 --latency 0.02
+    python benchmarks/run.py --output runs.jsonl --baseline runs.jsonl
+
+Everything runs against `server.BenchServer` on localhost, the images are synthetic and derived from `--seed`, so two
+runs with the same arguments on the same machine produce comparable numbers. Results are printed as JSON, appended to
+`--output` and compared against the last matching run in `--baseline`.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import hashlib
+import numpy as np
+import cv2
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import resource
+except ImportError:  # Windows.
+    resource = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from expandex import Locator  # noqa
+from expandex.index import extract_features  # noqa
+from server import BenchServer, Catalog, synthetic  # noqa
+
+HIGHER_IS_BETTER = ('images_per_second',)
+
+
+def peak_rss() -> [int, None]:
+    """
+    Peak resident set size of this process in bytes.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def environment() -> dict:
+    """
+    Commit, interpreter and machine a run was recorded on.
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def locator_for(args: argparse.Namespace, folder: str, server: [BenchServer, None] = None) -> Locator:
+    """
+    A locator configured from the command line, saving to `folder` and searching `server` when given.
+    """
+    locator = Locator(
+        save_folder=folder,
+        deduplicate=args.device if args.device != 'none' else False,
+        workers=args.workers,
+        tabs=args.tabs,
+        processes=args.processes,
+        http2=False,
+    )
+    if server is not None:
+        locator.search_url = server.search_url
+    return locator
+
+
+def bench_scout(args: argparse.Namespace) -> dict:
+    """
+    End to end scout throughput: upload, browser, viewer resolution, downloads, featurecrop, dedup and writes.
+    """
+    catalog = Catalog(args.count, args.duplicates, args.near, args.seed)
+    work = tempfile.mkdtemp(prefix='expandex_bench_')
+    source = os.path.join(work, 'source.jpg')
+    cv2.imwrite(source, catalog.source())
+    runs = list()
+    try:
+        with BenchServer(catalog, latency=args.latency) as server:
+            for repeat in range(args.repeat):
+                folder = os.path.join(work, f'run_{repeat}')
+                locator = locator_for(args, folder, server)
+                requests = server.requests
+                tracemalloc.start()
+                start = time.perf_counter()
+                links = locator.scout(source, depth=args.depth or len(catalog))
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                locator.close()
+                summary = links.summary
+                misresolved = sum(
+                    parse_qs(urlparse(link).query).get('pos') != [Path(urlparse(url).path).stem]
+                    for link, url in locator.resolved.items()
+                )
+                runs.append({
+                    'seconds': elapsed,
+                    'accepted': summary.counters.get('accepted', 0),
+                    'python_peak_bytes': peak,
+                    'stages': {stage: timing['seconds'] for stage, timing in summary.stages.items()},
+                    'counters': summary.counters,
+                    'requests': server.requests - requests,
+                    'misresolved': misresolved,
+                })
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    best = min(runs, key=lambda run: run['seconds'])
+    return {
+        'benchmark': 'scout',
+        'params': {
+            'count': args.count, 'duplicates': args.duplicates, 'near': args.near, 'depth': args.depth,
+            'latency': args.latency, 'workers': args.workers, 'tabs': args.tabs, 'processes': args.processes,
+            'device': args.device, 'seed': args.seed, 'repeat': args.repeat,
+        },
+        'metrics': {
+            'seconds': best['seconds'],
+            'median_seconds': float(np.median([run['seconds'] for run in runs])),
+            'images_per_second': best['accepted'] / best['seconds'] if best['seconds'] else 0.0,
+            'python_peak_bytes': max(run['python_peak_bytes'] for run in runs),
+            'peak_rss_bytes': peak_rss(),
+        },
+        'expected_unique': catalog.unique,
+        'best': best,
+    }
+
+
+def bench_dedup(args: argparse.Namespace) -> dict:
+    """
+    Cost of deduplicating one batch of candidates as the save folder grows.
+    """
+    if args.device == 'none':
+        return {'benchmark': 'dedup', 'skipped': 'deduplication disabled'}
+    work = tempfile.mkdtemp(prefix='expandex_bench_')
+    points = dict()
+    try:
+        locator = locator_for(args, work)
+        locator.mat = Image.fromarray(synthetic(args.seed, (1024, 768)))
+        manifest = locator._load_manifest()
+        stored = 0
+        for size in sorted(args.folder_sizes):
+            for i in range(stored, size):
+                name = f'stored_{i:06d}.png'
+                cv2.imwrite(os.path.join(work, name), synthetic(args.seed * 7919 + i + 1, (320, 240)))
+                with open(os.path.join(work, name), 'rb') as file:
+                    manifest.add(name, None, hashlib.md5(file.read()).hexdigest(), 320, 240)
+            stored = size
+            locator.index = None
+            start = time.perf_counter()
+            locator._prepare(args.batch)
+            load = time.perf_counter() - start
+            candidates = [synthetic(args.seed * 7919 + i + 1, (320, 240)) for i in range(min(size, args.batch // 2))]
+            candidates += [synthetic(args.seed * 104729 + i, (320, 240)) for i in range(args.batch - len(candidates))]
+            features = [extract_features(candidate) for candidate in candidates]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(candidates)) as pool:  # Concurrent, so candidates share batches.
+                duplicates = sum(pool.map(
+                    lambda i: bool(locator._deduplicate(candidates[i], f'candidate_{size}_{i}.png', features[i])),
+                    range(len(candidates)),
+                ))
+            elapsed = time.perf_counter() - start
+            for i in range(len(candidates)):
+                locator.index.remove(f'candidate_{size}_{i}.png')
+            points[size] = {
+                'index_load_seconds': load,
+                'seconds_per_candidate': elapsed / len(candidates),
+                'duplicates': duplicates,
+            }
+        locator.close()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        'benchmark': 'dedup',
+        'params': {'folder_sizes': args.folder_sizes, 'batch': args.batch, 'device': args.device, 'seed': args.seed},
+        'metrics': {f'seconds_per_candidate@{size}': point['seconds_per_candidate'] for size, point in points.items()},
+        'points': points,
+    }
+
+
+BENCHMARKS = {
+    'scout': bench_scout,
+    'dedup': bench_dedup,
+}
+
+
+def compare(result: dict, baseline: [str, None]):
+    """
+    Prints the change of every metric against the last run of the same benchmark and parameters in `baseline`.
+    """
+    if not baseline or not os.path.isfile(baseline) or 'metrics' not in result:
+        return
+    previous = None
+    with open(baseline, 'r') as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get('benchmark') == result['benchmark'] and record.get('params') == result['params']:
+                previous = record
+    if previous is None:
+        print(f"no baseline for {result['benchmark']} with these parameters")
+        return
+    for name, value in result['metrics'].items():
+        before = previous['metrics'].get(name)
+        if not before or value is None:
+            continue
+        change = (value - before) / before * 100
+        better = change > 0 if name in HIGHER_IS_BETTER else change < 0
+        print(f"{result['benchmark']:>6} {name:<32} {before:>14.4f} -> {value:>14.4f} {change:+7.1f}% "
+              f"{'better' if better else 'worse'}")
+
+
+def main():
+    """
+    Runs the requested benchmarks, prints their results, compares them with `--baseline` and appends them to `--output`.
+    """
+    parser = argparse.ArgumentParser(description='Offline expandex benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', help=f"any of {', '.join(BENCHMARKS)}, all of them by default")
+    parser.add_argument('--count', type=int, default=64, help='candidates on the similar images page')
+    parser.add_argument('--duplicates', type=float, default=0.1, help='share of byte identical candidates')
+    parser.add_argument('--near', type=float, default=0.2, help='share of resized / re-encoded candidates')
+    parser.add_argument('--depth', type=int, default=0, help='images to accept, 0 for every candidate')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--tabs', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=0)
+    parser.add_argument('--device', default='cpu', help="deduplication device, 'none' to disable")
+    parser.add_argument('--folder-sizes', type=int, nargs='+', default=[0, 100, 500, 1000])
+    parser.add_argument('--batch', type=int, default=16, help='candidates per dedup measurement')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='append the results to this JSON lines file')
+    parser.add_argument('--baseline', help='JSON lines file of earlier results to compare against')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    env = environment()
+    for name in args.benchmarks or list(BENCHMARKS):
+        result = BENCHMARKS[name](args)
+        result['environment'] = env
+        print(json.dumps(result, indent=2, default=str))
+        compare(result, args.baseline)
+        if args.output:
+            with open(args.output, 'a') as file:
+                file.write(json.dumps(result, default=str) + '\n')
+
+
+if __name__ == '__main__':
+    main()
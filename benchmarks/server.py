@@ -0,0 +1,294 @@
+"""
+Local stand-in for the Yandex endpoints and the image hosts the locator talks to.
+
+Serves the upload JSON endpoint, a search page carrying the similar images tab, the similar images page, viewer pages
+built from `Locator.selectors` and deterministic synthetic images (with a controlled share of exact and near
+duplicates). Listen on `localhost` rather than 127.0.0.1, the locator skips URLs pointing at the latter.
+"""
+import sys
+import json
+import html
+import time
+import threading
+import numpy as np
+import cv2
+from pathlib import Path
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs, quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from expandex.main import Locator  # noqa
+
+SIZES = [(640, 480), (1024, 768), (1600, 1200), (1920, 1080), (3000, 2000)]
+FORMATS = {'jpg': ('.jpg', 'image/jpeg'), 'png': ('.png', 'image/png'), 'webp': ('.webp', 'image/webp')}
+
+
+def nest(selector: str, inner: str) -> str:
+    """
+    HTML matching a `a > b.c > d` selector chain (skipping `body`), wrapped around `inner`.
+    """
+    markup = inner
+    for step in reversed([step.strip() for step in selector.split('>')]):
+        if step == 'body':
+            continue
+        if step.startswith('[id^='):  # Attribute prefix selector, any id starting with it will do.
+            markup = f'<div id="{step[6:-2]}bench">{markup}</div>'
+            continue
+        tag, *classes = step.split('.')
+        attributes = f' class="{" ".join(classes)}"' if classes else ''
+        markup = f'<{tag}{attributes}>{markup}</{tag}>'
+    return markup
+
+
+def synthetic(seed: int, size: tuple) -> np.ndarray:
+    """
+    A smooth random background with a few rectangles, reproducible from `seed`.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    image = cv2.resize(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8), (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(6):
+        x, y = int(rng.integers(0, width - 40)), int(rng.integers(0, height - 40))
+        w, h = int(rng.integers(20, width // 3)), int(rng.integers(20, height // 3))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
+    return image
+
+
+class Catalog:
+    """
+    The candidates the fake search engine returns.
+
+    A `duplicates` share of the entries serves exactly the same bytes as an earlier entry under another URL, and a
+    `near` share serves an earlier image at another size and format. Everything is derived from `seed` so two runs
+    with the same arguments see the same images.
+    """
+    def __init__(self, count: int = 64, duplicates: float = 0.1, near: float = 0.2, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.entries = list()
+        for i in range(count):
+            roll = rng.random()
+            if i and roll < duplicates:
+                entry = dict(self.entries[int(rng.integers(0, i))], kind='duplicate')
+            elif i and roll < duplicates + near:
+                entry = dict(self.entries[int(rng.integers(0, i))], kind='near')
+                entry['size'] = SIZES[int(rng.integers(0, len(SIZES)))]
+                entry['format'] = list(FORMATS)[int(rng.integers(0, len(FORMATS)))]
+            else:
+                entry = {
+                    'base': seed * 100003 + i + 1,
+                    'size': SIZES[int(rng.integers(0, len(SIZES)))],
+                    'format': list(FORMATS)[int(rng.integers(0, len(FORMATS)))],
+                    'kind': 'unique',
+                }
+            entry['sizes'] = i % 2 == 0  # Alternate between the resolution menu and the plain open button.
+            self.entries.append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def unique(self) -> int:
+        """
+        Number of distinct images behind the entries, the most a scout can accept.
+        """
+        return len({entry['base'] for entry in self.entries})
+
+    def source(self) -> np.ndarray:
+        """
+        The image the benchmark searches with, unlike any of the entries.
+        """
+        return synthetic(self.seed * 100003, (1024, 768))
+
+    @lru_cache(maxsize=256)
+    def encode(self, base: int, size: tuple, image_format: str) -> bytes:
+        """
+        Bytes of a synthetic image, cached since exact duplicates serve the same ones.
+        """
+        extension = FORMATS[image_format][0]
+        return cv2.imencode(extension, synthetic(base, size))[1].tobytes()
+
+    def image(self, position: int) -> tuple:
+        """
+        The bytes and content type served for an entry.
+        """
+        entry = self.entries[position]
+        return self.encode(entry['base'], entry['size'], entry['format']), FORMATS[entry['format']][1]
+
+
+class BenchServer:
+    """
+    Threaded HTTP server for a `Catalog`, optionally delaying every response by `latency` seconds.
+    """
+    def __init__(self, catalog: Catalog, latency: float = 0.0, port: int = 0):
+        self.catalog = catalog
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('localhost', port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Root URL of the server.
+        """
+        return f'http://localhost:{self.httpd.server_address[1]}'
+
+    @property
+    def search_url(self) -> str:
+        """
+        What to set as the locator's `search_url`.
+        """
+        return f'{self.url}/images/search'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        Serves from a daemon thread.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Shuts the server down and closes its socket.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def search_page(self) -> str:
+        """
+        The results page of an upload, holding the similar images tab.
+        """
+        button = nest(Locator.selectors['similar_image_button'], 'Similar')
+        button = button.replace('<a class', '<a href="/images/search?cbir_page=similar" class', 1)
+        return f'<html><body>{button}</body></html>'
+
+    def image_url(self, position: int) -> str:
+        """
+        Where the image of an entry is served.
+        """
+        return f'{self.url}/img/{position}{FORMATS[self.catalog.entries[position]["format"]][0]}'
+
+    def similar_page(self) -> str:
+        """
+        The similar images page, a viewer link for every entry.
+        """
+        links = ''.join(
+            f'<div><a href="/images/search?pos={i}&amp;img_url={quote(self.image_url(i), safe="")}&amp;rpt=imageview">'
+            f'{i}</a></div>' for i in range(len(self.catalog))
+        )
+        return f'<html><body><div>{links}</div></body></html>'
+
+    def state(self, position: int) -> str:
+        """
+        The JSON state of a viewer page, escaped for an attribute.
+
+        Like the real thing it lists related items next to the viewed one, bigger than it and with links to their
+        pages, which the resolver must not pick. The viewed item is only described on pages with a sizes menu, the
+        others leave the resolver nothing to go on and fall back to the browser.
+        """
+        entry = self.catalog.entries[position]
+        related = [(position + step) % len(self.catalog) for step in (1, 2)]
+        items = [
+            {
+                'pos': other,
+                'url': f'{self.url}/images/search?pos={other}',
+                'img_href': self.image_url(other),
+                'sizes': [{'url': self.image_url(other), 'w': 4000, 'h': 3000}],
+            } for other in related if other != position
+        ]
+        if entry['sizes']:
+            width, height = entry['size']
+            items.insert(0, {
+                'pos': position,
+                'img_href': self.image_url(position),
+                'sizes': [{'url': self.image_url(position), 'w': width, 'h': height}],
+            })
+        return html.escape(json.dumps({'viewer': {'items': items}}))
+
+    def viewer_page(self, position: int) -> str:
+        """
+        The viewer of an entry: its state and either a sizes menu or a plain open button.
+        """
+        entry = self.catalog.entries[position]
+        url = self.image_url(position)
+        state = f'<div data-state="{self.state(position)}"></div>'
+        if entry['sizes']:
+            width, height = entry['size']
+            options = ''.join(
+                f'<li><a href="{url}?scale={scale}">{width // scale}×{height // scale}</a></li>' for scale in (4, 2)
+            ) + f'<li><a href="{url}">{width}×{height}</a></li>'
+            menu = nest(Locator.selectors['resolution_dropdown'], 'Sizes')
+            links = nest(Locator.selectors['resolution_links'].rsplit('>', 1)[0], f'<ul>{options}</ul>')
+            return f'<html><body>{state}{menu}{links}</body></html>'
+        button = nest(Locator.selectors['open_button'], 'Open').replace('<a>', f'<a href="{url}">', 1)
+        return f'<html><body>{state}{button}</body></html>'
+
+    def _handler(self) -> type:
+        """
+        Request handler class bound to this server.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):  # noqa
+                pass
+
+            def _send(self, body: [str, bytes], content_type: str = 'text/html; charset=utf-8', status: int = 200):
+                """
+                Writes a complete response, headers only for HEAD.
+                """
+                if isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _route(self):
+                """
+                Dispatches a request to the page it asks for.
+                """
+                with server.lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                if parsed.path == '/images/search':
+                    if self.command == 'POST':
+                        length = int(self.headers.get('Content-Length', 0))
+                        self.rfile.read(length)
+                        payload = {'blocks': [{'params': {'url': 'rpt=imageview&cbir_id=bench'}}]}
+                        return self._send(json.dumps(payload), 'application/json')
+                    if 'pos' in query:
+                        return self._send(server.viewer_page(int(query['pos'][0])))
+                    if query.get('cbir_page') == ['similar']:
+                        return self._send(server.similar_page())
+                    return self._send(server.search_page())
+                if parsed.path.startswith('/img/'):
+                    position = int(Path(parsed.path).stem)
+                    if position >= len(server.catalog):
+                        return self._send('not found', 'text/plain', 404)
+                    body, content_type = server.catalog.image(position)
+                    return self._send(body, content_type)
+                return self._send('not found', 'text/plain', 404)
+
+            do_GET = _route
+            do_POST = _route
+            do_HEAD = _route
+
+        return Handler
@@ -1,4 +1,18 @@
 try:
-    from main import Locator
+    from main import Locator, ScoutResult, ScoutLinks
+    from aio import AsyncLocator
+    from session import SessionPool
+    from network import HttpClient, AsyncHttpClient
+    from cache import SearchCache
+    from policy import ResourcePolicy
+    from scheduler import HostScheduler
+    from metrics import Metrics, ScoutSummary, CallbackSink, JsonLinesSink, PrometheusSink
 except ImportError:
-    from .main import Locator
\ No newline at end of file
+    from .main import Locator, ScoutResult, ScoutLinks
+    from .aio import AsyncLocator
+    from .session import SessionPool
+    from .network import HttpClient, AsyncHttpClient
+    from .cache import SearchCache
+    from .policy import ResourcePolicy
+    from .scheduler import HostScheduler
+    from .metrics import Metrics, ScoutSummary, CallbackSink, JsonLinesSink, PrometheusSink
@@ -0,0 +1,474 @@
+"""
+Asyncio counterpart of the locator.
+"""
+import time
+import asyncio
+import numpy as np
+from pathlib import Path
+from PIL import Image
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from playwright.async_api import async_playwright
+from playwright._impl._errors import (  # noqa
+    Error,
+    TimeoutError
+)
+try:
+    from main import Locator, ScoutLinks
+    from network import AsyncHttpClient
+    from fetch import Rejected, read_image_async, probe_image_async, check_candidate, PROBE_SIZE
+    from resolve import parse_viewer, size_options, largest
+    from scheduler import Retry, HostUnavailable, check_status
+except ImportError:
+    from .main import Locator, ScoutLinks
+    from .network import AsyncHttpClient
+    from .fetch import Rejected, read_image_async, probe_image_async, check_candidate, PROBE_SIZE
+    from .resolve import parse_viewer, size_options, largest
+    from .scheduler import Retry, HostUnavailable, check_status
+
+
+class AsyncLocator(Locator):
+    """
+    Online image search using Yandex image lookup, for code that already runs an event loop.
+
+    It takes the same options and keeps the same state on disk (index, manifest, cache, metrics) as `Locator`. The
+    browser is driven through the Playwright async API and the network through an `AsyncHttpClient`. Every viewer
+    link becomes a task: HTTP resolution, browser tabs and downloads are bounded by the `http_resolvers`, `tabs` and
+    `workers` semaphores, which are shared by every scout running on this locator (requests only take a slot once the
+    scheduler lets them through to their host), and the CPU stages (decoding, featurecrop, deduplication, writes) run
+    in a thread executor (or the `processes` pool). Cancelling a scout, or reaching its `deadline`, cancels its
+    outstanding tasks and nothing else is written.
+
+    Use it as an async context manager so the browser and connections stay up between scouts, `scouts` bounds how many
+    sources `scout_many_async` works on at once.
+
+    The coroutines are the `Locator` methods of the same name with an `_async` suffix (`scout_async`,
+    `scout_many_async`, `download_image_async`...), the synchronous methods it inherits keep working as they do on a
+    `Locator`.
+    """
+    def __init__(self, *args, scouts: int = 4, launch_options: [dict, None] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scouts = scouts
+        self.launch_options = launch_options or dict()
+        self.playwright = None
+        self.browser = None
+        self.client = None
+        self.executor = None
+        self.http_slots = None
+        self.tab_slots = None
+        self.download_slots = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def start(self):
+        """
+        Starts the HTTP client, the executor and the browser if they are not up yet.
+        """
+        if self.client is None:
+            self.client = AsyncHttpClient(
+                self.http,
+                pool_maxsize=self.pool_size,
+                timeout=self.timeout,
+                http2=self.http2,
+                debug=self.debug,
+            )
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            self.http_slots = asyncio.Semaphore(max(self.http_resolvers, 1))
+            self.tab_slots = asyncio.Semaphore(max(self.tabs, 1))
+            self.download_slots = asyncio.Semaphore(max(self.workers, 1))
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        if self.browser is None:
+            self.d_print('launching browser')
+            self.browser = await self.playwright.firefox.launch(**self.launch_options)
+        return self
+
+    async def aclose(self):
+        """
+        Tears everything down, see `Locator.close` for the synchronous parts.
+        """
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Error:
+                pass
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.close()
+        return self
+
+    async def _run(self, function: any, *args) -> any:
+        """
+        Runs a blocking call on our executor.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    @asynccontextmanager
+    async def web_context(self, destination_url: str):
+        """
+        A fresh browser context carrying the cloudscraper cookies of `destination_url`.
+        """
+        start = time.perf_counter()
+        context = await self.browser.new_context()
+        try:
+            await context.add_cookies(await self._run(self.http.browser_cookies, destination_url))
+            self.metrics.record('browser', time.perf_counter() - start)
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Error:
+                pass
+
+    async def _new_page_async(self, context: any) -> any:
+        """
+        A page carrying our resource policy and timeouts.
+        """
+        page = await context.new_page()
+        page.set_default_navigation_timeout(self.timeouts['navigation'])
+        page.set_default_timeout(self.timeouts['selector'])
+        if self.policy:
+            await self.policy.apply_async(page)
+        return page
+
+    async def get_search_root_async(self, image: Image.Image) -> [str, None]:
+        """
+        Uploads an image and returns the search URL, see `Locator.get_search_root`.
+        """
+        self.mat = image
+        self.source_features = None
+        cached = await self._run(self._lookup, image)
+        if self.fully_cached:
+            self.d_print('search results cached, skipping upload')
+            return None
+        if cached.get('search_url'):
+            self.d_print('search url cached, skipping upload')
+            return cached['search_url']
+        request = await self._run(self._upload_request, image)
+        with self.metrics.timer('upload'):
+            response = await self.client.post(self.search_url, **request)
+        return await self._run(self._search_root, response.content)
+
+    async def _collect_similar_links_async(self, page: any) -> list:
+        """
+        Opens the similar images tab and collects the viewer links, or returns them from the cache.
+        """
+        if self.cached and self.cached['links'] is not None:
+            return list(self.cached['links'])
+        image_links = list()
+        button = self.selectors['similar_image_button']
+        with self.metrics.timer('collect'):
+            await page.wait_for_selector(button, timeout=self.timeouts['selector'])
+            before = len(await page.query_selector_all(self.selectors['similar_links']))
+            await page.click(button)
+            await page.wait_for_function(
+                'args => document.querySelectorAll(args[0]).length > args[1]',
+                arg=[self.selectors['similar_links'], before],
+                timeout=self.timeouts['selector'],
+            )
+            for element in await page.query_selector_all('div a'):
+                link = await element.get_attribute('href')
+                if link and '/images/search?' in link:
+                    image_links.append(f"{self.search_url}{link.replace('/images/search', '')}")
+        if self.cache is not None:
+            await self._run(lambda: self.cache.put(self.cache_key, links=image_links))
+        return image_links
+
+    async def get_image_link_async(self, context: any, link: str, attempts: int = 3) -> [str, None]:
+        """
+        Opens a viewer page in its own tab and returns the URL of the largest size it offers.
+        """
+        page = await self._new_page_async(context)
+        try:
+            for attempt in range(attempts):
+                try:
+                    await page.goto(link, wait_until='commit')
+                    await page.wait_for_selector(
+                        f"{self.selectors['resolution_dropdown']}, {self.selectors['open_button']}",
+                        state='attached',
+                        timeout=self.timeouts['viewer'],
+                    )
+                    dropdown = await page.query_selector(self.selectors['resolution_dropdown'])
+                    if dropdown is not None:
+                        await dropdown.click(timeout=self.timeouts['viewer'])
+                        menu = await page.wait_for_selector(
+                            self.selectors['resolution_links'],
+                            state='attached',
+                            timeout=self.timeouts['viewer'],
+                        )
+                        options = [
+                            (await option.text_content(), await option.get_attribute('href'))
+                            for option in await menu.query_selector_all('li a')
+                        ]
+                        return largest(size_options(options))
+                    button = await page.query_selector(self.selectors['open_button'])
+                    if button is None:
+                        self.d_print('no resolution options were found')
+                        return None
+                    return await button.get_attribute('href')
+                except TimeoutError:
+                    delay = self.scheduler.backoff(attempt)
+                    if attempt + 1 >= attempts or delay >= self.cutoff.remaining:
+                        break
+                    self.metrics.count('retries')
+                    self.d_print(f'timed out reading {link}, attempt {attempt + 1} of {attempts}')
+                    await asyncio.sleep(delay)
+            return None
+        finally:
+            try:
+                await page.close()
+            except Error:
+                pass
+
+    async def _get_async(self, url: str, **kwargs) -> any:
+        """
+        See `Locator._get`.
+        """
+        return check_status(await self.client.get(url, **kwargs))
+
+    async def _resolve_over_http_async(self, link: str) -> [str, None]:
+        """
+        See `Locator._resolve_over_http`.
+        """
+        with self.metrics.timer('resolve_http'):
+            try:
+                response = await self.scheduler.run_async(
+                    link,
+                    self._get_async,
+                    link,
+                    headers={'User-Agent': 'Mozilla/5.0'},
+                    deadline=self.cutoff,
+                    metrics=self.metrics,
+                    slots=self.http_slots,
+                )
+            except Exception as err:  # noqa
+                self.d_print(f'unable to fetch viewer {link}: {err}')
+                return None
+            if response.status_code != 200:
+                return None
+            return largest(parse_viewer(response.text, link))
+
+    async def resolve_link(self, context: any, link: str) -> [str, None]:
+        """
+        Resolves one viewer link: from the cache, over HTTP, and in a browser tab when both fail.
+        """
+        if link in self.resolved:
+            self.metrics.count('resolved.cache')
+            self.resolved_by[link] = 'cache'
+            return self.resolved[link]
+        url, path = None, 'http'
+        if self.http_resolvers > 0:
+            url = await self._resolve_over_http_async(link)
+        if url is None and context is not None:
+            path = 'browser'
+            async with self.tab_slots:
+                with self.metrics.timer('resolve'):
+                    url = await self.get_image_link_async(context, link)
+        if url is not None:
+            self.metrics.count(f'resolved.{path}')
+            self.resolved[link] = url
+            self.resolved_by[link] = path
+        return url
+
+    async def _fetch_async(self, image_url: str) -> [tuple, None]:
+        """
+        See `Locator._fetch`.
+        """
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        with self.metrics.timer('download'):
+            async with self.client.stream(image_url, headers=headers) as response:
+                check_status(response)
+                if response.status_code != 200:
+                    self.d_print(f"Failed to download {image_url}. Status code: {response.status_code}")
+                    self.metrics.count('rejected.status')
+                    return None
+                try:
+                    content, info = await read_image_async(response, self.max_bytes, self.max_pixels)
+                    check_candidate(info, self.min_side, self.formats)
+                except Rejected as err:
+                    self.d_print(f'skipping {image_url}: {err}')
+                    self.metrics.count('rejected.fetch')
+                    return None
+        self.metrics.count('bytes', len(content))
+        return content, info
+
+    async def _probe_async(self, image_url: str) -> tuple:
+        """
+        See `Locator._probe`.
+        """
+        headers = {'User-Agent': 'Mozilla/5.0', 'Range': f'bytes=0-{PROBE_SIZE - 1}'}
+        with self.metrics.timer('probe'):
+            async with self.client.stream(image_url, headers=headers) as response:
+                check_status(response)
+                if response.status_code not in (200, 206):
+                    self.d_print(f"Failed to probe {image_url}. Status code: {response.status_code}")
+                    self.metrics.count('rejected.status')
+                    return False, None
+                try:
+                    content, info, complete = await probe_image_async(
+                        response, self.max_bytes, self.max_pixels, self.min_side, self.formats
+                    )
+                except Rejected as err:
+                    self.d_print(f'skipping {image_url}: {err}')
+                    self.metrics.count('rejected.probe')
+                    return False, None
+        self.metrics.count('bytes', len(content))
+        if complete:
+            self.metrics.count('probe.complete')
+            return True, (content, info)
+        return True, None
+
+    async def _download_async(self, image_url: str) -> [tuple, None]:
+        """
+        See `Locator._download`.
+        """
+        fetched = None
+        if self.probe:
+            keep, fetched = await self._probe_async(image_url)
+            if not keep:
+                return None
+        if fetched is None:
+            fetched = await self._fetch_async(image_url)
+        return fetched
+
+    async def download_image_async(self, image_url: str) -> [str, None]:
+        """
+        See `Locator.download_image`, the image is processed on the executor.
+        """
+        skip, path = await self._run(self._precheck, image_url)
+        if skip:
+            return path
+        try:
+            try:
+                fetched = await self.scheduler.run_async(
+                    image_url,
+                    self._download_async,
+                    image_url,
+                    deadline=self.cutoff,
+                    metrics=self.metrics,
+                    slots=self.download_slots,
+                )
+            except (Retry, HostUnavailable) as err:
+                self._gave_up(image_url, err)
+                return None
+            if fetched is None:
+                return None
+            return await self._run(self._store, image_url, *fetched)
+        finally:
+            self.manifest.release(image_url)
+
+    async def _handle(self, context: any, link: str, result: list):
+        """
+        Resolves a link and downloads what it points at.
+        """
+        try:
+            url = await self.resolve_link(context, link)
+            if url is None or self.quota.full:
+                return
+            result.append(url)
+            await self.download_image_async(url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:  # noqa
+            self.d_print(f'unable to process {link}: {err}')
+
+    async def get_similar_images_async(self, context: any, page: any, depth: int = 4) -> list:
+        """
+        Collects the similar images and works through them concurrently until `depth` images have been accepted,
+        then cancels whatever is left.
+        """
+        await self._run(self._prepare, depth)
+        image_links = await self._collect_similar_links_async(page)
+        result = list()
+        tasks = [asyncio.ensure_future(self._handle(context, link, result)) for link in image_links]
+        pending = set(tasks)
+        try:
+            while pending and not self.quota.full and not self._expired():
+                remaining = self.cutoff.remaining
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=None if remaining == float('inf') else remaining,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+        finally:
+            if pending:
+                self.quota.close()  # Work still running on the executor must not write anything now.
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            await self._run(self._store_resolved)
+            if self.index is not None:
+                await self._run(self.index.save)
+        if self.quota.full and not self.cutoff.expired:
+            self.d_print('successfully located the requested image depth, operation complete')
+        return result
+
+    async def scout_async(self, image: [Path, np.ndarray, Image.Image, str], depth: int = 10) -> ScoutLinks:
+        """
+        Send a path, or image mat and discover similar images, see `Locator.scout`.
+
+        Every call runs on a child locator of its own that saves into our folder, so scouts can run at the same time.
+        """
+        await self.start()
+        await self._run(self._open_folder)
+        child = self._spawn(self._source_key(image), shared=True)
+        result = await child._scout_async(image, depth)
+        self.summary = child.summary
+        return result
+
+    async def _scout_async(self, image: [Path, np.ndarray, Image.Image, str], depth: int = 10) -> ScoutLinks:
+        """
+        The scout of one source, on a child locator holding its per scout state.
+        """
+        self._start_metrics(self._source_key(image))
+        try:
+            image = await self._run(self._get_image_from_anything, image)
+            search_url = await self.get_search_root_async(image)
+            if search_url is None:
+                return self._finish_metrics(await self.get_similar_images_async(None, None, depth))
+            async with self.web_context(search_url) as context:
+                page = await self._new_page_async(context)
+                with self.metrics.timer('search_page'):
+                    await page.goto(search_url, wait_until='domcontentloaded')
+                result = await self.get_similar_images_async(context, page, depth)
+            return self._finish_metrics(result)
+        finally:
+            await self._run(self._retire)
+
+    async def scout_many_async(self, images: any, depth: int = 10) -> dict:
+        """
+        Scouts a collection of sources, `scouts` at a time, sharing this locator's browser, connections and limits.
+        Every source is saved in a folder of its own, as `Locator.scout_many` does.
+
+        Returns a map of source key to resolved links, or to the exception that source raised.
+        """
+        await self.start()
+        slots = asyncio.Semaphore(max(self.scouts, 1))
+
+        async def run(image: any) -> tuple:
+            key = self._source_key(image)
+            child = self._spawn(key)
+            async with slots:
+                try:
+                    return key, await child._scout_async(image, depth)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:  # noqa
+                    self.d_print(f'unable to scout {key}: {err}')
+                    return key, err
+                finally:
+                    await self._run(child._close_folder)
+
+        return dict(await asyncio.gather(*(run(image) for image in images)))
@@ -0,0 +1,231 @@
+"""
+Batched deduplication of the candidates currently in flight.
+"""
+import queue
+import threading
+import numpy as np
+try:
+    from index import hash_key
+except ImportError:
+    from .index import hash_key
+
+
+class BatchDeduplicator:
+    """
+    Collects the candidates the download threads hand in, embeds them with one forward pass and scores the whole batch
+    against the stored embeddings (and against itself) with NumPy matrix products. The candidates still standing are
+    then checked against their `verify` nearest stored images by `verifier`, again for the whole batch at once. Without
+    a verifier the approximate hash and thumbnail scores of the index (`FeatureIndex.match`) stand in for it.
+
+    The batch thread is started on the first `check`, `close` stops it.
+    """
+    def __init__(
+            self,
+            index_getter: any,
+            embedder: any,
+            source_getter: any,
+            source_check: any,
+            limits: dict,
+            verifier: any = None,
+            verify: int = 3,
+            radius: int = 40,
+            reject: int = 6,
+            max_batch: int = 32,
+            window: float = 0.05,
+            debug: bool = False,
+    ):
+        self.index_getter = index_getter
+        self.embedder = embedder
+        self.source_getter = source_getter
+        self.source_check = source_check
+        self.limits = limits
+        self.verifier = verifier
+        self.verify = verify
+        self.radius = radius
+        self.reject = reject
+        self.max_batch = max_batch
+        self.window = window
+        self.debug = debug
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def check(self, name: str, image: np.ndarray, features: dict) -> bool:
+        """
+        Blocks until the batch holding this candidate has been scored, returns True for duplicates.
+
+        Accepted candidates are reserved in the index under `name` straight away so the next batch can see them, the
+        caller should `refresh` or `remove` the entry once it knows whether the image was written.
+
+        The full comparison against the source, for candidates within the prefilter radius of it, runs here on the
+        calling thread so it never holds up the batch.
+        """
+        self._check_source(image, features)
+        item = {
+            'name': name,
+            'image': image,
+            'features': features,
+            'done': threading.Event(),
+            'duplicate': False,
+            'error': None,
+        }
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, args=(self.pending,), daemon=True)
+                self.worker.start()
+            self.pending.put(item)
+        item['done'].wait()
+        if item['error'] is not None:
+            raise item['error']
+        return item['duplicate']
+
+    def _check_source(self, image: np.ndarray, features: dict):
+        """
+        Fills in `source_duplicate` when the candidate is close enough to the source to need the models.
+
+        Candidates within `reject` of the source, or of a stored image, are left to the hash tier.
+        """
+        if features.get('source_duplicate') is not None or self.source_check is None:
+            return
+        distance = (hash_key(features) ^ hash_key(self.source_getter())).bit_count()
+        if distance <= self.reject or distance > self.radius:
+            return
+        if self.index_getter().neighbors(features, self.reject):
+            return
+        features['source_duplicate'] = bool(self.source_check(image))
+
+    def close(self):
+        """
+        Stops the batch thread once the candidates already handed in are scored, the next `check` starts a new one.
+        """
+        with self.lock:
+            worker, pending = self.worker, self.pending
+            self.worker, self.pending = None, queue.Queue()
+        if worker is not None:
+            pending.put(None)
+            worker.join()
+        return self
+
+    def _collect(self, pending: queue.Queue) -> tuple:
+        """
+        Waits for a candidate then gathers whatever else arrives within the batching window, along with whether
+        `close` was called.
+        """
+        item = pending.get()
+        if item is None:
+            return list(), True
+        batch = [item]
+        while len(batch) < self.max_batch:
+            try:
+                item = pending.get(timeout=self.window)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, pending: queue.Queue):
+        """
+        Batch loop, runs until `close`.
+        """
+        while True:
+            batch, closed = self._collect(pending)
+            if batch:
+                try:
+                    self.decide(batch)
+                except Exception as err:  # noqa
+                    for item in batch:
+                        item['error'] = err
+                for item in batch:
+                    item['done'].set()
+            if closed:
+                return
+
+    def decide(self, batch: list) -> list:
+        """
+        Scores a batch in arrival order and reserves the survivors in the index.
+        """
+        index = self.index_getter()
+        source_key = hash_key(self.source_getter())
+        keys = [hash_key(item['features']) for item in batch]
+        neighbors = [index.neighbors(item['features'], self.radius) for item in batch]
+        cnn = set()
+        for i, item in enumerate(batch):  # Hash tier.
+            source_distance = (keys[i] ^ source_key).bit_count()
+            item['features']['scores'] = {
+                'source_distance': source_distance,
+                'nearest': neighbors[i][0][1] if neighbors[i] else None,
+                'nearest_distance': neighbors[i][0][0] if neighbors[i] else None,
+                'dedup': None,
+            }
+            peers = [
+                (j, (keys[i] ^ keys[j]).bit_count()) for j in range(i) if not batch[j]['duplicate']
+            ]
+            if (
+                    source_distance <= self.reject or
+                    (neighbors[i] and neighbors[i][0][0] <= self.reject) or
+                    any(distance <= self.reject for _, distance in peers)
+            ):
+                self.d_print(f"hash prefilter found duplicate: {item['name']}")
+                item['duplicate'] = True
+                continue
+            if item['features'].get('source_duplicate'):
+                item['duplicate'] = True
+                continue
+            close = [j for j, distance in peers if distance <= self.radius]
+            if neighbors[i] or close:
+                cnn.add(i)
+                cnn.update(close)
+        for i in sorted(cnn):  # Cheap vector checks against the stored images, when nothing better is at hand.
+            if self.verifier is not None or batch[i]['duplicate'] or not neighbors[i]:
+                continue
+            limits = dict(self.limits, dedup=0)
+            match = index.match(batch[i]['features'], limits, names=[name for _, name in neighbors[i]])
+            if match is not None:
+                self.d_print(f"duplicate of {match}: {batch[i]['name']}")
+                batch[i]['duplicate'] = True
+        rows = [i for i in sorted(cnn) if not batch[i]['duplicate']]
+        if rows and self.limits.get('dedup', 0) > 0 and self.embedder is not None:  # CNN tier.
+            embeddings = np.asarray(self.embedder([batch[i]['image'] for i in rows]), dtype=np.float32)
+            embeddings = embeddings.reshape(len(rows), -1)
+            for i, embedding in zip(rows, embeddings):
+                batch[i]['features']['embedding'] = embedding
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            unit = embeddings / norms
+            index.fill_embeddings(sorted({name for i in rows for _, name in neighbors[i]}))
+            names, stored = index.unit_embeddings()
+            threshold = 1.0 - self.limits['dedup']
+            best = np.full(len(rows), -1.0, dtype=np.float32)
+            if stored is not None and len(names):
+                best = np.round(unit @ stored.T, 4).max(axis=1)
+            stored_hits = best > threshold
+            within = np.round(unit @ unit.T, 4) > threshold
+            accepted = list()
+            for position, i in enumerate(rows):
+                batch[i]['features']['scores']['dedup'] = float(1.0 - best[position]) if len(names) else None
+                if stored_hits[position] or within[position, accepted].any():
+                    self.d_print(f"cnn found duplicate: {batch[i]['name']}")
+                    batch[i]['duplicate'] = True
+                else:
+                    accepted.append(position)
+        rows = [i for i in sorted(cnn) if not batch[i]['duplicate'] and neighbors[i]]
+        if rows and self.verifier is not None:  # Full tier, against the nearest stored images.
+            pairs = [(i, name) for i in rows for _, name in neighbors[i][:self.verify]]
+            verdicts = self.verifier([(batch[i]['image'], name) for i, name in pairs])
+            for (i, name), duplicate in zip(pairs, verdicts):
+                if duplicate and not batch[i]['duplicate']:
+                    self.d_print(f"duplicate of {name}: {batch[i]['name']}")
+                    batch[i]['duplicate'] = True
+        for item in batch:
+            if not item['duplicate']:
+                index.add(item['name'], item['features'])
+        return batch
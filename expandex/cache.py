@@ -0,0 +1,154 @@
+"""
+On-disk cache of reverse-search results.
+"""
+import os
+import json
+import time
+import threading
+
+
+class SearchCache:
+    """
+    Remembers what a reverse search found for a source image, keyed by a content hash of the image.
+
+    Every entry is a small JSON file holding the search URL, the viewer links of the similar images page and the
+    high-res URLs those viewers resolved to, each part stamped with the time it was stored. The search URL expires after
+    `search_ttl` seconds, everything else after `ttl`. Reading an entry touches its file, and once the cache holds more
+    than `max_entries` entries or `max_bytes` bytes the least recently used ones are deleted.
+    """
+    def __init__(
+            self,
+            folder: str = '~/.cache/expandex',
+            ttl: float = 7 * 24 * 3600.0,
+            search_ttl: float = 24 * 3600.0,
+            max_entries: int = 10000,
+            max_bytes: int = 64 * 1024 * 1024,
+            debug: bool = False,
+    ):
+        self.folder = os.path.expanduser(folder)
+        self.ttl = ttl
+        self.search_ttl = search_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.debug = debug
+        self.lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def _path(self, key: str) -> str:
+        """
+        Where an entry lives on disk.
+        """
+        return os.path.join(self.folder, f'{key}.json')
+
+    def _read(self, key: str) -> dict:
+        """
+        The stored entry, empty when it is missing or unreadable.
+        """
+        try:
+            with open(self._path(key), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return dict()
+
+    def get(self, key: str) -> dict:
+        """
+        The parts of an entry that have not expired: `search_url` and `links` (None when missing or stale) and
+        `resolved`, a map of viewer link to image URL.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self._read(key)
+            if entry:
+                try:
+                    os.utime(self._path(key))
+                except OSError:
+                    pass
+        result = {'search_url': None, 'links': None, 'resolved': dict()}
+        search_url = entry.get('search_url')
+        if search_url and now - search_url['time'] < self.search_ttl:
+            result['search_url'] = search_url['value']
+        links = entry.get('links')
+        if links and now - links['time'] < self.ttl:
+            result['links'] = links['value']
+        for link, url in entry.get('resolved', dict()).items():
+            if now - url['time'] < self.ttl:
+                result['resolved'][link] = url['value']
+        if entry:
+            self.d_print(f"cache hit {key}: {len(result['resolved'])} resolved links")
+        return result
+
+    def put(self, key: str, search_url: [str, None] = None, links: [list, None] = None, resolved: [dict, None] = None):
+        """
+        Merges new parts into an entry, resolved links that are already stored keep their original timestamp.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self._read(key)
+            if search_url is not None:
+                entry['search_url'] = {'value': search_url, 'time': now}
+            if links is not None:
+                entry['links'] = {'value': list(links), 'time': now}
+            if resolved:
+                stored = entry.setdefault('resolved', dict())
+                for link, url in resolved.items():
+                    if url is not None and stored.get(link, dict()).get('value') != url:
+                        stored[link] = {'value': url, 'time': now}
+            path = self._path(key)
+            temp_file = f'{path}.tmp'
+            with open(temp_file, 'w') as file:
+                json.dump(entry, file)
+            os.replace(temp_file, path)
+            self._evict()
+        return self
+
+    def _evict(self):
+        """
+        Drops the least recently used entries until we are back under both limits.
+        """
+        entries = list()
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, name = entries.pop(0)
+            self.d_print(f'evicting {name}')
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+            total -= size
+
+    def remove(self, key: str):
+        """
+        Deletes an entry.
+        """
+        with self.lock:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        return self
+
+    def clear(self):
+        """
+        Empties the cache.
+        """
+        with self.lock:
+            for name in os.listdir(self.folder):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.folder, name))
+        return self
@@ -0,0 +1,263 @@
+"""
+Memory bounded image downloads.
+"""
+import math
+import struct
+from io import BytesIO
+from PIL import Image
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_LIMIT = 512 * 1024
+PROBE_SIZE = 64 * 1024
+ACCEPTED_TYPES = ('image/', 'application/octet-stream', 'binary/')
+
+
+class Rejected(Exception):
+    """
+    Raised when a download is refused before, or while, it is read.
+    """
+
+
+def parse_header(data: [bytes, bytearray]) -> [dict, None]:
+    """
+    Hand rolled header parsing for the formats whose PIL plugins want the whole file (WebP) or that are trivial.
+    """
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+            width, height = struct.unpack('>II', data[16:24])
+            return {'format': 'png', 'width': width, 'height': height}
+        if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+            width, height = struct.unpack('<HH', data[6:10])
+            return {'format': 'gif', 'width': width, 'height': height}
+        if data[:2] == b'BM' and len(data) >= 26:
+            width, height = struct.unpack('<ii', data[18:26])
+            return {'format': 'bmp', 'width': abs(width), 'height': abs(height)}
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', data[26:30])
+                return {'format': 'webp', 'width': width & 0x3FFF, 'height': height & 0x3FFF}
+            if chunk == b'VP8L':
+                bits = struct.unpack('<I', data[21:25])[0]
+                return {'format': 'webp', 'width': (bits & 0x3FFF) + 1, 'height': ((bits >> 14) & 0x3FFF) + 1}
+            if chunk == b'VP8X':
+                width = int.from_bytes(data[24:27], 'little') + 1
+                height = int.from_bytes(data[27:30], 'little') + 1
+                return {'format': 'webp', 'width': width, 'height': height}
+    except struct.error:
+        pass
+    return None
+
+
+def sniff(data: [bytes, bytearray]) -> [dict, None]:
+    """
+    Reads the format and dimensions from the first bytes of an image, None until the header is complete.
+
+    Image.open is lazy, it only parses the header so no pixels are allocated here.
+    """
+    info = parse_header(data)
+    if info is not None:
+        return info
+    try:
+        with Image.open(BytesIO(data)) as image:
+            width, height = image.size
+            return {'format': str(image.format).lower(), 'width': width, 'height': height}
+    except Image.DecompressionBombError as err:
+        raise Rejected(str(err))
+    except (OSError, SyntaxError, ValueError, EOFError):
+        return None
+
+
+def check_headers(headers: dict, max_bytes: int):
+    """
+    Refuses responses that announce themselves as something other than a reasonably sized image.
+    """
+    content_type = headers.get('Content-Type', '')
+    if content_type and not content_type.lower().startswith(ACCEPTED_TYPES):
+        raise Rejected(f'content type {content_type}')
+    length = headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > max_bytes:
+        raise Rejected(f'content length {length} exceeds {max_bytes}')
+
+
+def check_dimensions(info: dict, max_pixels: int):
+    """
+    Refuses images with too many pixels.
+    """
+    if info['width'] * info['height'] > max_pixels:
+        raise Rejected(f"{info['width']}x{info['height']} exceeds {max_pixels} pixels")
+
+
+def check_candidate(info: dict, min_side: int = 0, formats: [tuple, None] = None):
+    """
+    Refuses images smaller than `min_side` on their shorter side, or in a format outside `formats`.
+    """
+    if min(info['width'], info['height']) < min_side:
+        raise Rejected(f"{info['width']}x{info['height']} is smaller than {min_side} pixels")
+    if formats and info['format'] not in formats:
+        raise Rejected(f"{info['format']} is not one of {', '.join(formats)}")
+
+
+def total_size(response: any) -> [int, None]:
+    """
+    Size of the whole resource behind a (possibly ranged) response, if the server told us.
+    """
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def probe_image(
+        response: any,
+        max_bytes: int,
+        max_pixels: int,
+        min_side: int = 0,
+        formats: [tuple, None] = None,
+        limit: int = PROBE_SIZE,
+) -> tuple:
+    """
+    Reads the response to a `Range: bytes=0-<limit - 1>` request and sniffs the header from it, applying
+    `check_candidate` as soon as the header is known. Servers that ignore the range answer 200 with the whole body,
+    which is then read to the end rather than fetched twice.
+
+    Returns the bytes, the header info (None when the header lies beyond `limit`) and whether the bytes are the whole
+    image. Raises Rejected for anything `read_image` would refuse.
+    """
+    check_headers(response.headers, max_bytes)
+    total = total_size(response)
+    if total is not None and total > max_bytes:
+        raise Rejected(f'{total} bytes exceeds {max_bytes}')
+    data = bytearray()
+    info = None
+    complete = True
+    for chunk in response.iter_content(CHUNK_SIZE):
+        info = _probe_feed(data, info, chunk, max_bytes, max_pixels, min_side, formats)
+        if response.status_code == 206 and len(data) >= limit:
+            complete = False
+            break
+    return _probed(data, info, complete, total)
+
+
+async def probe_image_async(
+        response: any,
+        max_bytes: int,
+        max_pixels: int,
+        min_side: int = 0,
+        formats: [tuple, None] = None,
+        limit: int = PROBE_SIZE,
+) -> tuple:
+    """
+    `probe_image` for an httpx async streaming response.
+    """
+    check_headers(response.headers, max_bytes)
+    total = total_size(response)
+    if total is not None and total > max_bytes:
+        raise Rejected(f'{total} bytes exceeds {max_bytes}')
+    data = bytearray()
+    info = None
+    complete = True
+    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+        info = _probe_feed(data, info, chunk, max_bytes, max_pixels, min_side, formats)
+        if response.status_code == 206 and len(data) >= limit:
+            complete = False
+            break
+    return _probed(data, info, complete, total)
+
+
+def _probe_feed(
+        data: bytearray,
+        info: [dict, None],
+        chunk: bytes,
+        max_bytes: int,
+        max_pixels: int,
+        min_side: int,
+        formats: [tuple, None],
+) -> [dict, None]:
+    """
+    `_feed` for a probe, also checking the candidate as soon as its header is known.
+    """
+    known = info is not None
+    info = _feed(data, info, chunk, max_bytes, max_pixels)
+    if not known and info is not None:
+        check_candidate(info, min_side, formats)
+    return info
+
+
+def _probed(data: bytearray, info: [dict, None], complete: bool, total: [int, None]) -> tuple:
+    """
+    The outcome of a probe: the whole image when the server sent all of it, otherwise the bytes read so far.
+    """
+    if total is not None and total > len(data):
+        complete = False
+    if complete:
+        return _finish(data, info) + (True,)
+    return bytes(data), info, False
+
+
+def read_image(response: any, max_bytes: int, max_pixels: int) -> tuple:
+    """
+    Streams a response body, checking the headers first and the image dimensions as soon as they can be parsed.
+
+    Returns the raw bytes and the sniffed header info, raises Rejected as early as possible otherwise.
+    """
+    check_headers(response.headers, max_bytes)
+    data = bytearray()
+    info = None
+    for chunk in response.iter_content(CHUNK_SIZE):
+        info = _feed(data, info, chunk, max_bytes, max_pixels)
+    return _finish(data, info)
+
+
+async def read_image_async(response: any, max_bytes: int, max_pixels: int) -> tuple:
+    """
+    `read_image` for an httpx async streaming response.
+    """
+    check_headers(response.headers, max_bytes)
+    data = bytearray()
+    info = None
+    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+        info = _feed(data, info, chunk, max_bytes, max_pixels)
+    return _finish(data, info)
+
+
+def _feed(data: bytearray, info: [dict, None], chunk: bytes, max_bytes: int, max_pixels: int) -> [dict, None]:
+    """
+    Appends a chunk, sniffing the header until we have it.
+    """
+    data.extend(chunk)
+    if len(data) > max_bytes:
+        raise Rejected(f'body exceeds {max_bytes} bytes')
+    if info is None:
+        info = sniff(data)
+        if info is not None:
+            check_dimensions(info, max_pixels)
+        elif len(data) > SNIFF_LIMIT:
+            raise Rejected('no image header found')
+    return info
+
+
+def _finish(data: bytearray, info: [dict, None]) -> tuple:
+    """
+    The downloaded bytes and their header info, raises Rejected when they are not an image.
+    """
+    if info is None:
+        info = sniff(data)
+    if info is None:
+        raise Rejected('not an image')
+    return bytes(data), info
+
+
+def decode_image(data: [bytes, memoryview], info: dict, decode_size: [int, None] = None) -> Image.Image:
+    """
+    Opens the downloaded bytes, JPEGs far bigger than `decode_size` (longest side) use draft mode so the decoder
+    only produces a reduced image.
+    """
+    image = Image.open(BytesIO(data))
+    longest = max(info['width'], info['height'])
+    if decode_size and info['format'] in ('jpeg', 'mpo') and longest >= 2 * decode_size:
+        scale = decode_size / longest
+        image.draft('RGB', (math.ceil(info['width'] * scale), math.ceil(info['height'] * scale)))
+    return image
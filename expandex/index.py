@@ -0,0 +1,443 @@
+"""
+Persistent per-folder feature index used for deduplication.
+"""
+import os
+import threading
+import numpy as np
+from PIL import Image
+
+INDEX_NAME = '.expandex_index.npz'
+INDEX_VERSION = 2
+HASH_SIZE = 8
+THUMB_SIZE = 32
+DCT_SIZE = 32
+
+
+def _dct_matrix(size: int = DCT_SIZE) -> np.ndarray:
+    """
+    Orthonormal DCT-II basis so a 2D transform is just two matrix products.
+    """
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+DCT = _dct_matrix()
+
+
+def _pack(bits: np.ndarray) -> int:
+    """
+    Packs a boolean array into an integer.
+    """
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+
+def average_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    8x8 average hash packed into an integer, this mirrors the `ih` signal used by Antidupe.
+    """
+    image = image.resize((hash_size, hash_size)).convert('L')
+    pixels = np.asarray(image, dtype=np.float32)
+    return _pack(pixels > pixels.mean())
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    DCT based pHash, robust against scaling and recompression.
+    """
+    pixels = np.asarray(image.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS), dtype=np.float32)
+    low = (DCT @ pixels @ DCT.T)[:hash_size, :hash_size]
+    return _pack(low > np.median(low))
+
+
+def difference_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    Horizontal gradient dHash.
+    """
+    pixels = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def thumbnail_vector(image: Image.Image, size: int = THUMB_SIZE) -> np.ndarray:
+    """
+    Small unit length RGB vector used to approximate the `cs` (NumPy cosine similarity) signal.
+    """
+    image = image.convert('RGB').resize((size, size))
+    vector = np.asarray(image, dtype=np.float32).flatten()
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def extract_features(image: [np.ndarray, Image.Image]) -> dict:
+    """
+    The cheap hashes and vectors kept in the feature index, embeddings are filled in later when needed.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    return {
+        'hash': average_hash(image),
+        'phash': perceptual_hash(image),
+        'dhash': difference_hash(image),
+        'vector': thumbnail_vector(image),
+        'embedding': None,
+    }
+
+
+def hamming(a: np.ndarray, b: int) -> np.ndarray:
+    """
+    Bit distances between an array of packed hashes and a single hash.
+    """
+    xor = np.bitwise_xor(a.astype(np.uint64), np.uint64(b))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes using the Hamming distance.
+
+    Radius lookups only visit the branches that can hold a match, so checking a candidate against a large folder costs
+    microseconds rather than a model pass per image.
+    """
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key: int, item: any):
+        """
+        Insert an item under its hash.
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [item], dict()]
+            return self
+        node = self.root
+        while True:
+            distance = (key ^ node[0]).bit_count()
+            if not distance:
+                node[1].append(item)
+                break
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [item], dict()]
+                break
+            node = child
+        return self
+
+    def query(self, key: int, radius: int) -> list:
+        """
+        Returns (distance, item) pairs within the radius, nearest first.
+        """
+        result = list()
+        if self.root is None or radius < 0:
+            return result
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = (key ^ node[0]).bit_count()
+            if distance <= radius:
+                result.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        result.sort(key=lambda pair: pair[0])
+        return result
+
+
+def hash_key(features: dict) -> int:
+    """
+    Joins the pHash and dHash into one 128 bit key for the BK-tree.
+    """
+    return (features['phash'] << 64) | features['dhash']
+
+
+class FeatureIndex:
+    """
+    Keeps the hashes and embeddings of every image in a save folder.
+
+    Hashes are computed once when an image is saved, held in memory, and written next to the images so the next run
+    can reload them instead of decoding the whole folder again. Embeddings are filled in the first time a candidate
+    lands near an image in the BK-tree, so images nothing ever comes close to never pay for a model pass.
+    """
+    def __init__(
+            self,
+            folder: str,
+            extractor: any,
+            embedder: any = None,
+            listing: any = None,
+            debug: bool = False,
+    ):
+        self.folder = folder
+        self.extractor = extractor
+        self.embedder = embedder
+        self.listing = listing
+        self.debug = debug
+        self.path = os.path.join(folder, INDEX_NAME)
+        self.lock = threading.RLock()
+        self.names = list()
+        self.stats = list()
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.keys = list()
+        self.tree = BKTree()
+        self.vectors = np.zeros((0, THUMB_SIZE * THUMB_SIZE * 3), dtype=np.float32)
+        self.embeddings = None
+        self.dirty = False
+        self.load()
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def _stat(self, name: str) -> [tuple, None]:
+        """
+        Size and modification time used to validate stored entries.
+        """
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self):
+        """
+        Reload a stored index, drop stale entries and pick up any images it does not know about yet.
+
+        New images are found through `listing` (a callable returning the image names, see `Manifest`) when we have
+        one, otherwise by listing the folder and letting PIL open every file.
+        """
+        with self.lock:
+            if os.path.isfile(self.path):
+                try:
+                    with np.load(self.path, allow_pickle=False) as data:
+                        if int(data['version']) == INDEX_VERSION:
+                            self.names = [str(n) for n in data['names']]
+                            self.stats = [tuple(int(v) for v in s) for s in data['stats']]
+                            self.hashes = data['hashes'].astype(np.uint64)
+                            self.keys = [(int(p) << 64) | int(d) for p, d in data['keys']]
+                            self.vectors = data['vectors'].astype(np.float32)
+                            if data['embeddings'].size:
+                                self.embeddings = data['embeddings'].astype(np.float32)
+                        else:
+                            self.d_print('index version mismatch, rebuilding')
+                except (OSError, ValueError, KeyError) as err:
+                    self.d_print(f'unable to read index {self.path}: {err}')
+                    self.names, self.stats, self.keys = list(), list(), list()
+                    self.hashes = np.zeros(0, dtype=np.uint64)
+                    self.vectors = np.zeros((0, THUMB_SIZE * THUMB_SIZE * 3), dtype=np.float32)
+                    self.embeddings = None
+            keep = [i for i, name in enumerate(self.names) if self._stat(name) == self.stats[i]]
+            if len(keep) != len(self.names):
+                self.d_print(f'dropping {len(self.names) - len(keep)} stale index entries')
+                self._select(keep)
+                self.dirty = True
+            else:
+                self._build_tree()
+            known = set(self.names)
+            listing = self.listing() if self.listing is not None else sorted(os.listdir(self.folder))
+            for image_file in listing:
+                if image_file in known or image_file == INDEX_NAME:
+                    continue
+                image_file_path = os.path.join(self.folder, image_file)
+                if self.listing is None and os.path.isdir(image_file_path):
+                    continue
+                try:
+                    with Image.open(image_file_path) as im:  # Raises for anything that is not an image.
+                        features = self.extractor(im)
+                except (IOError, OSError):
+                    continue
+                self.add(image_file, features)
+            if self.dirty:
+                self.save()
+        return self
+
+    def _select(self, keep: list):
+        """
+        Keep only the rows listed.
+        """
+        self.names = [self.names[i] for i in keep]
+        self.stats = [self.stats[i] for i in keep]
+        self.keys = [self.keys[i] for i in keep]
+        self.hashes = self.hashes[keep]
+        self.vectors = self.vectors[keep]
+        if self.embeddings is not None:
+            self.embeddings = self.embeddings[keep]
+        self._build_tree()
+
+    def _build_tree(self):
+        """
+        Rebuild the BK-tree from the stored keys.
+        """
+        self.tree = BKTree()
+        for name, key in zip(self.names, self.keys):
+            self.tree.add(key, name)
+
+    def save(self):
+        """
+        Write the index next to the images.
+        """
+        with self.lock:
+            embeddings = self.embeddings if self.embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+            temp_path = f'{self.path}.tmp.npz'
+            np.savez(
+                temp_path,
+                version=np.array(INDEX_VERSION),
+                names=np.array(self.names, dtype=str),
+                stats=np.array(self.stats, dtype=np.int64).reshape(-1, 2),
+                hashes=self.hashes,
+                keys=np.array([(k >> 64, k & 0xFFFFFFFFFFFFFFFF) for k in self.keys], dtype=np.uint64).reshape(-1, 2),
+                vectors=self.vectors,
+                embeddings=embeddings,
+            )
+            os.replace(temp_path, self.path)
+            self.dirty = False
+        return self
+
+    def add(self, name: str, features: dict):
+        """
+        Record the features of an image that has just been written (or is about to be) to the folder.
+        """
+        with self.lock:
+            stat = self._stat(name) or (0, 0)
+            if name in self.names:
+                self._select([i for i, n in enumerate(self.names) if n != name])
+            embedding = features.get('embedding')
+            if embedding is not None:
+                embedding = embedding.reshape(1, -1).astype(np.float32)
+                if self.embeddings is None:
+                    self.embeddings = np.full((len(self.names), embedding.shape[1]), np.nan, dtype=np.float32)
+                self.embeddings = np.vstack([self.embeddings, embedding])
+            elif self.embeddings is not None:
+                self.embeddings = np.vstack(
+                    [self.embeddings, np.full((1, self.embeddings.shape[1]), np.nan, dtype=np.float32)]
+                )
+            self.names.append(name)
+            self.stats.append(stat)
+            self.hashes = np.append(self.hashes, np.uint64(features['hash']))
+            self.keys.append(hash_key(features))
+            self.tree.add(self.keys[-1], name)
+            self.vectors = np.vstack([self.vectors, features['vector'].reshape(1, -1)])
+            self.dirty = True
+        return self
+
+    def refresh(self, name: str):
+        """
+        Update the stored size and modification time once a reserved image has actually been written.
+        """
+        with self.lock:
+            if name in self.names:
+                self.stats[self.names.index(name)] = self._stat(name) or (0, 0)
+                self.dirty = True
+        return self
+
+    def remove(self, name: str):
+        """
+        Forget an image, used when a reserved candidate ends up not being written.
+        """
+        with self.lock:
+            if name in self.names:
+                self._select([i for i, n in enumerate(self.names) if n != name])
+                self.dirty = True
+        return self
+
+    def neighbors(self, features: dict, radius: int) -> list:
+        """
+        Stored images whose combined pHash/dHash lies within the radius, as (distance, name) pairs.
+        """
+        with self.lock:
+            return self.tree.query(hash_key(features), radius)
+
+    def _fill_embeddings(self, rows: list):
+        """
+        Compute the embeddings of stored images the first time a candidate lands near them, in a single batch.
+        """
+        if self.embedder is None:
+            return
+        missing, images = list(), list()
+        for row in rows:
+            if self.embeddings is not None and not np.isnan(self.embeddings[row, 0]):
+                continue
+            try:
+                with Image.open(os.path.join(self.folder, self.names[row])) as im:
+                    images.append(im.convert('RGB'))
+            except (IOError, OSError):
+                continue
+            missing.append(row)
+        if not missing:
+            return
+        embeddings = np.asarray(self.embedder(images), dtype=np.float32).reshape(len(missing), -1)
+        if self.embeddings is None:
+            self.embeddings = np.full((len(self.names), embeddings.shape[1]), np.nan, dtype=np.float32)
+        self.embeddings[missing] = embeddings
+        self.dirty = True
+
+    def fill_embeddings(self, names: list):
+        """
+        Make sure the named images have embeddings.
+        """
+        with self.lock:
+            self._fill_embeddings([self.names.index(name) for name in names if name in self.names])
+        return self
+
+    def unit_embeddings(self) -> tuple:
+        """
+        Names and unit length embeddings of every image that has one, ready for a single matrix product.
+        """
+        with self.lock:
+            if self.embeddings is None:
+                return list(), None
+            valid = np.flatnonzero(~np.isnan(self.embeddings[:, 0]))
+            stored = self.embeddings[valid]
+            norms = np.linalg.norm(stored, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return [self.names[i] for i in valid], stored / norms
+
+    def match(self, features: dict, limits: dict, names: [list, None] = None) -> [str, None]:
+        """
+        Compare a candidate against the stored vectors and return the name of the first duplicate found.
+
+        Scores are scaled the same way Antidupe scales them so the existing limits apply unchanged. When names are
+        given only those rows are compared.
+        """
+        with self.lock:
+            if not self.names:
+                return None
+            if names is None:
+                rows = list(range(len(self.names)))
+            else:
+                rows = [self.names.index(name) for name in names if name in self.names]
+            if not rows:
+                return None
+            duplicate = np.zeros(len(rows), dtype=bool)
+            if limits.get('ih', 0) > 0:
+                duplicate |= hamming(self.hashes[rows], features['hash']) / 64.0 < limits['ih']
+            if limits.get('cs', 0) > 0:
+                cs = np.clip((1.0 - self.vectors[rows] @ features['vector']) * 10, 0, 1)
+                duplicate |= cs < limits['cs']
+            embedding = features.get('embedding')
+            if limits.get('dedup', 0) > 0 and embedding is not None:
+                self._fill_embeddings(rows)
+            if limits.get('dedup', 0) > 0 and embedding is not None and self.embeddings is not None:
+                embedding = embedding.flatten()
+                stored = self.embeddings[rows]
+                norms = np.linalg.norm(stored, axis=1) * np.linalg.norm(embedding)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    dedup = 1.0 - np.round((stored @ embedding) / norms, 4)
+                duplicate |= np.nan_to_num(dedup, nan=1.0) < limits['dedup']
+            hits = np.flatnonzero(duplicate)
+            if hits.size:
+                return self.names[rows[hits[0]]]
+        return None
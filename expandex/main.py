@@ -3,17 +3,20 @@ import os
 import cv2
 import PIL
 import sys
-import json
 import time
-import imghdr
+import copy
+import json
 import hashlib
-import requests
-import cloudscraper
+import queue
+import threading
 import numpy as np
 from antidupe import Antidupe
 from featurecrop import featurecrop
 from pathlib import Path
-from threading import Thread
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
 from io import BytesIO
 from playwright.sync_api import sync_playwright
@@ -21,6 +24,34 @@ from playwright._impl._errors import (  # noqa
     Error,
     TimeoutError
 )
+try:
+    from index import FeatureIndex, extract_features, perceptual_hash
+    from batch import BatchDeduplicator
+    from pipeline import Pipeline, Quota
+    from session import SessionPool
+    from fetch import Rejected, read_image, decode_image, probe_image, check_candidate, PROBE_SIZE
+    from network import HttpClient
+    from workers import ProcessStage
+    from cache import SearchCache
+    from store import Manifest, content_name, EXTENSIONS
+    from metrics import Metrics
+    from resolve import parse_viewer, largest
+    from policy import ResourcePolicy
+    from scheduler import HostScheduler, Deadline, Retry, HostUnavailable, DeadlineExceeded, check_status
+except ImportError:
+    from .index import FeatureIndex, extract_features, perceptual_hash
+    from .batch import BatchDeduplicator
+    from .pipeline import Pipeline, Quota
+    from .session import SessionPool
+    from .fetch import Rejected, read_image, decode_image, probe_image, check_candidate, PROBE_SIZE
+    from .network import HttpClient
+    from .workers import ProcessStage
+    from .cache import SearchCache
+    from .store import Manifest, content_name, EXTENSIONS
+    from .metrics import Metrics
+    from .resolve import parse_viewer, largest
+    from .policy import ResourcePolicy
+    from .scheduler import HostScheduler, Deadline, Retry, HostUnavailable, DeadlineExceeded, check_status
 
 test_image = Path('./bug.jpg')
 
@@ -35,6 +66,12 @@ image_extensions = [
     ".svg",
 ]
 
+TIMEOUTS = {
+    'navigation': 30000,  # Page loads, until the document has been parsed.
+    'selector': 15000,  # The similar images tab and its results.
+    'viewer': 10000,  # The size menu or open button of a viewer page.
+}  # Milliseconds.
+
 DEFAULTS = {
     'ih': 0.1,  # 8x8x1 Image Hash similarity.
     'ssim': 0.15,  # Structural similarity index measurement.
@@ -44,19 +81,48 @@ DEFAULTS = {
 }
 
 
+@dataclass
+class ScoutResult:
+    """
+    An image that was accepted and written to the save folder.
+    """
+    url: str
+    path: str
+    width: int
+    height: int
+    scores: dict = field(default_factory=dict)
+
+
+class ScoutLinks(list):
+    """
+    The links a scout resolved, with the `ScoutSummary` of that scout attached.
+    """
+    summary = None
+
+
 class Locator:
     """
     Online image search using Yandex image lookup.
     """
     term = False
-    retries = dict()
     search_url = 'https://yandex.com/images/search'
     context = None
-    returns = 0
     depth = 0
     size = (0, 0)
     mat = None
-    threads = 0
+    quota = Quota(0)
+    cutoff = Deadline()
+    index = None
+    manifest = None
+    session = None
+    owns_session = False
+    key = ''
+    on_accept = None
+    stage = None
+    source_features = None
+    cache_key = None
+    cached = None
+    summary = None
 
     selectors = {
         'similar_image_button': '[id^="CbirNavigation-"] > nav > div > div > div > div > '
@@ -82,45 +148,342 @@ class Locator:
                        'div.ImagesViewer-TopSide > div.ImagesViewer-LayoutSideblock > div > div > div > '
                        'div.MMViewerButtons > div.OpenImageButton.OpenImageButton_text.MMViewerButtons-OpenImageSizes '
                        '> a',
+        'similar_links': 'div a[href*="/images/search?"]',
     }
 
-    def __init__(self, save_folder: str = '', deduplicate: str = 'cpu', weights: dict = DEFAULTS, debug: bool = False):  # noqa
+    def __init__(
+            self,
+            save_folder: str = '',
+            deduplicate: str = 'cpu',
+            weights: dict = DEFAULTS,  # noqa
+            debug: bool = False,
+            prefilter_radius: int = 40,
+            prefilter_reject: int = 6,
+            dedup_batch: int = 32,
+            dedup_window: float = 0.05,
+            workers: int = 8,
+            queue_size: int = 16,
+            tabs: int = 4,
+            session: [SessionPool, None] = None,
+            max_bytes: int = 64 * 1024 * 1024,
+            max_pixels: int = 64_000_000,
+            decode_size: [int, None] = 4096,
+            timeout: float = 30.0,
+            pool_size: int = 32,
+            http2: bool = True,
+            http: [HttpClient, None] = None,
+            processes: int = 0,
+            cache: [SearchCache, None] = None,
+            sinks: [list, None] = None,
+            http_resolvers: int = 8,
+            policy: [ResourcePolicy, bool, None] = None,
+            timeouts: [dict, None] = None,
+            probe: bool = True,
+            min_side: int = 0,
+            formats: [tuple, None] = None,
+            scheduler: [HostScheduler, None] = None,
+            deadline: [float, None] = None,
+    ):
+        """
+        `prefilter_radius` and `prefilter_reject` are bit distances over the combined 128 bit pHash/dHash: candidates
+        within `prefilter_reject` of a known image are dropped right away, those within `prefilter_radius` go on to the
+        models, and anything further out is accepted without running them.
+
+        Candidates that arrive within `dedup_window` seconds of each other are embedded together, up to `dedup_batch`
+        at a time.
+
+        Downloads run on a pool of `workers` threads fed through a queue holding at most `queue_size` resolved links.
+        Viewer pages are resolved across `tabs` pages of the same browser context.
+
+        Pass a `session` (or use the locator as a context manager) to keep the browser warm between scouts.
+
+        Downloads are streamed and dropped as soon as they exceed `max_bytes` or their header reports more than
+        `max_pixels`. JPEGs at least twice `decode_size` on their longest side are decoded, and saved, at reduced scale.
+
+        All network traffic goes through one keep-alive `http` client with `pool_size` connections per host (HTTP/2
+        for downloads when httpx and h2 are installed), pass your own to share it between locators.
+
+        With `processes` above zero featurecrop, feature extraction and the comparison against the source run in that
+        many worker processes instead of the download threads.
+
+        Give a `cache` to remember the search URL, viewer links and resolved image URLs of every source, a repeat scout
+        of the same image then skips the upload and, when every link is already resolved, the browser.
+
+        Every scout times its stages and counts what it downloaded, accepted and rejected, events go to the `sinks`
+        (see `metrics`) as they happen and the summary of each scout is attached to its results.
+
+        Viewer pages are first fetched over HTTP by `http_resolvers` threads and parsed for the image sizes, the browser
+        only opens the ones that could not be read that way. Set it to 0 to always use the browser.
+
+        Browser pages skip images, media, fonts and analytics unless you pass another `policy` (False loads everything),
+        and wait for the elements we read instead of network idle, each step bounded by `timeouts` (see TIMEOUTS).
+
+        With `probe` every candidate is first requested for its first bytes only (a Range request), images whose
+        shorter side is below `min_side` or whose format is not in `formats` (e.g. ('jpeg', 'png')) are dropped
+        before the full transfer, and small images are taken straight from the probe.
+
+        Viewer pages and downloads go through a `scheduler` (see `HostScheduler`, share one between locators) that
+        paces every host, retries timeouts, 429 and 5xx answers with backoff and stops sending work to hosts that keep
+        failing, workers skip ahead to other hosts while one is busy. A scout stops starting new work once `deadline`
+        seconds have passed and returns what it has.
+        """
         self.debug = debug
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.decode_size = decode_size
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.http2 = http2
+        self.http = http or HttpClient(pool_maxsize=pool_size, timeout=timeout, http2=http2, debug=debug)
+        self.session = session
+        self.tabs = tabs
+        self.workers = workers
+        self.queue_size = queue_size
         self.save_folder = save_folder
         self.deduplicate = deduplicate
+        self.weights = weights
+        self.prefilter_radius = prefilter_radius
+        self.prefilter_reject = prefilter_reject
+        self.dedup_batch = dedup_batch
+        self.dedup_window = dedup_window
+        self.processes = processes
+        self.cache = cache
+        self.resolved = dict()
+        self.resolved_by = dict()
+        self.http_resolvers = http_resolvers
+        self.policy = ResourcePolicy(debug=debug) if policy is None else policy
+        self.timeouts = dict(TIMEOUTS, **(timeouts or dict()))
+        self.probe = probe
+        self.min_side = min_side
+        self.formats = formats
+        self.scheduler = scheduler or HostScheduler(debug=debug)
+        self.deadline = deadline
+        self.lock = threading.RLock()
+        self.sinks = sinks or list()
+        self.metrics = Metrics(self.sinks)
         if self.deduplicate:
             self.deduplicator = Antidupe(
                 device=self.deduplicate,
                 limits=weights,
                 debug=self.debug
             )
+            self.batcher = self._make_batcher()
 
-    def _deduplicate(self, image: np.ndarray) -> bool:
+    def _make_batcher(self) -> BatchDeduplicator:
         """
-        Checks to see if the image is a duplicate of one of the ones in the save folder.
+        Batch deduplication stage bound to this locator's index and source image.
         """
-        result = False
-        images = os.listdir(self.save_folder)
-        if self.deduplicator.predict([image.copy(), self.mat.copy()]):  # Check original.
-            result = True
-        else:
-            for image_file in images:  # Check downloaded images.
-                if self.term:
-                    break
-                image_file_path = os.path.join(self.save_folder, image_file)
-                if os.path.isdir(image_file_path):
-                    continue
-                if not imghdr.what(image_file_path):
-                    continue
-                try:
-                    im = Image.open(image_file_path)
-                except (IOError, OSError):
-                    continue
-                dupe = self.deduplicator.predict([image.copy(), im])
-                if dupe:
-                    result = True
-                    break
-        return result
+        return BatchDeduplicator(
+            index_getter=self._load_index,
+            embedder=self._embed_batch if self.weights.get('dedup', 0) > 0 else None,
+            source_getter=self._source_features,
+            source_check=self._source_check,
+            limits=self.weights,
+            verifier=self._verify_batch,
+            radius=self.prefilter_radius,
+            reject=self.prefilter_reject,
+            max_batch=self.dedup_batch,
+            window=self.dedup_window,
+            debug=self.debug,
+        )
+
+    def __enter__(self):
+        if self.session is None:
+            self.session = SessionPool(http=self.http, debug=self.debug)
+            self.owns_session = True
+        self.session.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.owns_session:
+            self.session.close()
+            self.session, self.owns_session = None, False
+        if self.stage is not None:
+            self.stage.close()
+            self.stage = None
+
+    def close(self):
+        """
+        Releases the worker processes, the browser pool (if we own it), the batch thread, the manifest and the HTTP
+        connections.
+        """
+        self.__exit__(None, None, None)
+        if self.deduplicate:
+            self.batcher.close()
+        self._close_folder()
+        self.http.close()
+        return self
+
+    def _stage(self) -> ProcessStage:
+        """
+        The process pool, started on first use and shared with the children of `scout_many`.
+        """
+        with self.lock:
+            if self.stage is None:
+                self.stage = ProcessStage(
+                    workers=self.processes,
+                    limits=self.weights,
+                    device=self.deduplicate or None,
+                    radius=self.prefilter_radius,
+                    reject=self.prefilter_reject,
+                    debug=self.debug,
+                )
+        return self.stage
+
+    def _retire(self):
+        """
+        Lets go of what the scout that just finished was holding on to: its source image in the process pool and its
+        batch deduplication thread.
+        """
+        if self.stage is not None:
+            self.stage.release_source(self.key)
+        if self.deduplicate:
+            self.batcher.close()
+        return self
+
+    def _process(self, image: np.ndarray) -> tuple:
+        """
+        Featurecrop and feature extraction in the process pool, returns the crop and its features.
+        """
+        stage = self._stage()
+        if self.deduplicate:
+            stage.set_source(self.key, self.mat, self._source_features())
+        image, features, source_duplicate = stage.process(image, self.key)
+        features['source_duplicate'] = source_duplicate
+        return image, features
+
+    def _features(self, image: [np.ndarray, Image.Image]) -> dict:
+        """
+        Computes the cheap hashes and vectors we keep in the feature index.
+        """
+        return extract_features(image)
+
+    def _embed_batch(self, images: list) -> np.ndarray:
+        """
+        Mobilenet embeddings (the `dedup` signal of Antidupe) for a list of images in a single forward pass.
+        """
+        import torch  # noqa
+        dedup = self.deduplicator.dedup
+        encoder = dedup.cnn_encoder
+        tensors = list()
+        for image in images:
+            if isinstance(image, np.ndarray):
+                image = Image.fromarray(image)
+            array = dedup.preprocess_image(image)
+            if array.ndim == 2:
+                array = np.repeat(array[:, :, np.newaxis], 3, axis=2)
+            tensors.append(encoder.apply_preprocess(array))
+        with torch.no_grad():
+            embeddings = encoder.model(torch.stack(tensors).to(encoder.device))
+        return embeddings.cpu().numpy()
+
+    def _open_stored(self, name: str) -> [Image.Image, None]:
+        """
+        An image of the save folder, None when it cannot be read.
+        """
+        try:
+            with Image.open(os.path.join(self.save_folder, name)) as image:
+                return image.convert('RGB')
+        except (IOError, OSError):
+            return None
+
+    def _verify_batch(self, pairs: list) -> list:
+        """
+        The Antidupe comparison of (candidate, stored image name) pairs, whether each is a duplicate.
+
+        The signals and limits are those of `Antidupe.predict` (identical pixels, `ih`, `ssim`, `cs`, then `cnn`), on
+        images sized the same way, but the EfficientNet pass of every pair still undecided runs as one batch. `dedup`
+        is left to the embedding tier of the batcher.
+        """
+        import torch  # noqa
+        from torchvision import transforms  # noqa
+        from antidupe.utilities import (  # noqa
+            resize_image, image_converter, euclidean_distance, image_hash, ssim, cosine_similarity
+        )
+        limits = self.weights
+        cnn = self.deduplicator.cnn
+        transform = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ])
+        verdicts = [False] * len(pairs)
+        rows, tensors = list(), list()
+        for position, (image, name) in enumerate(pairs):
+            stored = self._open_stored(name)
+            if stored is None:
+                continue
+            im_1, im_2 = resize_image(image, stored, 512)
+            if (
+                    euclidean_distance(im_1, im_2) == 0.0 or
+                    (limits.get('ih', 0) > 0 and image_hash(im_1, im_2) < limits['ih']) or
+                    (limits.get('ssim', 0) > 0 and ssim(im_1, im_2, self.deduplicate != 'cpu') < limits['ssim']) or
+                    (limits.get('cs', 0) > 0 and cosine_similarity(im_1, im_2, self.deduplicate) < limits['cs'])
+            ):
+                verdicts[position] = True
+            elif limits.get('cnn', 0) > 0:
+                tensors += [transform(image_converter(im_1, size=224)), transform(image_converter(im_2, size=224))]
+                rows.append(position)
+        if not rows:
+            return verdicts
+        with torch.no_grad():
+            features = cnn.model.extract_features(torch.stack(tensors).to(cnn.device)).cpu().numpy()
+        for k, position in enumerate(rows):
+            distance = round(float(np.linalg.norm(features[2 * k] - features[2 * k + 1])), 4) / 1000
+            verdicts[position] = distance < limits['cnn']
+        return verdicts
+
+    def _load_index(self):
+        """
+        Opens the feature index belonging to the current save folder.
+        """
+        if self.index is None or self.index.folder != self.save_folder:
+            embedder = None
+            if self.deduplicate and self.weights.get('dedup', 0) > 0:
+                embedder = self._embed_batch
+            self.index = FeatureIndex(
+                self.save_folder,
+                extractor=self._features,
+                embedder=embedder,
+                listing=self._load_manifest().names,
+                debug=self.debug,
+            )
+        return self.index
+
+    def _load_manifest(self) -> Manifest:
+        """
+        Opens the manifest of the current save folder.
+        """
+        with self.lock:
+            if self.manifest is None or self.manifest.folder != self.save_folder:
+                self.manifest = Manifest(self.save_folder, debug=self.debug)
+        return self.manifest
+
+    def _source_features(self) -> dict:
+        """
+        Hashes of the image we are searching with.
+        """
+        if self.source_features is None:
+            self.source_features = self._features(self.mat)
+        return self.source_features
+
+    def _source_check(self, image: np.ndarray) -> bool:
+        """
+        Full Antidupe comparison against the original, both are handed over as they are (the candidate read-only).
+        """
+        return self.deduplicator.predict([image, self.mat])
+
+    def _deduplicate(self, image: np.ndarray, name: str, features: [dict, None] = None) -> bool:
+        """
+        Checks to see if the image is a duplicate of the original or one of the ones in the save folder.
+
+        The candidate joins whatever else is in flight: the hash prefilter runs first and only those that land near
+        something are embedded, together, and scored against the stored embeddings, the survivors then go through the
+        other Antidupe signals against their nearest stored images (see `_verify_batch`). Those left standing are
+        reserved in the index under `name`.
+        """
+        if features is None:
+            features = self._features(image)
+        return self.batcher.check(name, image, features)
 
     def d_print(self, *args, **kwargs):
         """
@@ -129,6 +492,13 @@ class Locator:
         if self.debug:
             print(*args, **kwargs)
 
+    @property
+    def returns(self) -> int:
+        """
+        Number of images accepted so far.
+        """
+        return self.quota.count
+
     def _set_save_folder(self, location: str) -> None:
         """
         Configure our save directory
@@ -181,11 +551,13 @@ class Locator:
                 file_name = 'url'
             file_name = file_name.lower()
             self._set_save_folder(file_name)
-            original_setting = bool(self.deduplicate)
-            self.deduplicate, self.returns = False, -1
-            self.download_image(image)
-            self.deduplicate, self.returns = original_setting, 0
-            result = Image.open(f"{self.save_folder}/{file_name}")
+            original_setting, original_quota = self.deduplicate, self.quota
+            self.deduplicate, self.quota = False, Quota(1)
+            path = self.download_image(image)
+            self.deduplicate, self.quota = original_setting, original_quota
+            if path is None:
+                raise FileNotFoundError(image)
+            result = Image.open(path)
         else:
             raise TypeError(f'unable to locate image from {type(image)}')
         return result
@@ -251,28 +623,51 @@ class Locator:
         answer = page.query_selector(selector)
         return answer is not None
 
-    def init_web(self, destination_url: str, callback: any, *args, **kwargs) -> any:
+    def _new_page(self) -> any:
         """
-        This will create our web contexts allowing us to interact with the remote data.
+        A page in the current context carrying our resource policy and navigation timeout.
         """
-        scraper = cloudscraper.create_scraper()
+        page = self.context.new_page()
+        page.set_default_navigation_timeout(self.timeouts['navigation'])
+        page.set_default_timeout(self.timeouts['selector'])
+        if self.policy:
+            self.policy.apply(page)
+        return page
+
+    @contextmanager
+    def web_page(self, destination_url: str):
+        """
+        Opens a page on `destination_url` for the duration of a with block.
+
+        Borrows a warm context when we have a session pool, otherwise launches a browser just for this block.
+        """
+        start = time.perf_counter()
+        if self.session is not None:
+            with self.session.context(destination_url) as context:
+                self.context = context
+                page = self._new_page()
+                self.metrics.record('browser', time.perf_counter() - start)
+                try:
+                    with self.metrics.timer('search_page'):
+                        page.goto(destination_url, wait_until='domcontentloaded')
+                    yield page
+                finally:
+                    try:
+                        page.close()
+                    except Error:
+                        pass
+            return
         try:
             with sync_playwright() as p:
                 browser = p.firefox.launch()
                 self.context = browser.new_context()
                 url = destination_url
-                response = scraper.get(url)
-                cookies = list()
-                for c in response.cookies:
-                    name, value, domain = c.name, c.value, c.domain
-                    cookie = {"name": name, "value": value, "domain": domain, 'path': '/'}
-                    self.d_print(cookie)
-                    cookies.append(cookie)
-                self.context.add_cookies(cookies)
-                page = self.context.new_page()
-                page.goto(url)
-                kwargs['page'] = page
-                result = callback(*args, **kwargs)
+                self.context.add_cookies(self.http.browser_cookies(url))
+                page = self._new_page()
+                self.metrics.record('browser', time.perf_counter() - start)
+                with self.metrics.timer('search_page'):
+                    page.goto(url, wait_until='domcontentloaded')
+                yield page
                 page.close()
                 self.context.close()
                 browser.close()
@@ -284,17 +679,71 @@ class Locator:
                 pass
             finally:
                 sys.exit()
-        finally:
-            scraper.close()
-        return result
 
-    def get_search_root(self, image: Image.Image) -> str:
+    def init_web(self, destination_url: str, callback: any, *args, **kwargs) -> any:
+        """
+        This will create our web contexts allowing us to interact with the remote data.
+        """
+        with self.web_page(destination_url) as page:
+            kwargs['page'] = page
+            return callback(*args, **kwargs)
+
+    def _lookup(self, image: Image.Image) -> dict:
+        """
+        Loads what the cache knows about this source, keyed by the MD5 of its RGB pixels.
+        """
+        self.cache_key, self.cached, self.resolved, self.resolved_by = None, None, dict(), dict()
+        if self.cache is None:
+            return dict()
+        pixels = np.ascontiguousarray(np.asarray(image.convert('RGB')))
+        self.cache_key = self.generate_md5(f'{pixels.shape}'.encode() + pixels.tobytes())
+        self.cached = self.cache.get(self.cache_key)
+        self.resolved = dict(self.cached['resolved'])
+        return self.cached
+
+    @property
+    def fully_cached(self) -> bool:
+        """
+        True when the cache holds the viewer links of the current source and every one of them is resolved.
+        """
+        if not self.cached or self.cached['links'] is None:
+            return False
+        return all(link in self.resolved for link in self.cached['links'])
+
+    def _store_resolved(self):
+        """
+        Writes the links resolved so far back to the cache.
+        """
+        if self.cache is not None and self.cache_key is not None:
+            self.cache.put(self.cache_key, resolved=self.resolved)
+
+    def get_search_root(self, image: Image.Image) -> [str, None]:
         """
         Uploads an image to pasteboard and returns its URL.
 
+        With a cache the stored search URL is returned instead, and None when the cache already holds every resolved
+        link (there is nothing left to search).
+
         NOTE: Image_path must be a full path to a local image file **not** relative.
         """
         self.mat = image
+        self.source_features = None
+        cached = self._lookup(image)
+        if self.fully_cached:
+            self.d_print('search results cached, skipping upload')
+            return None
+        if cached.get('search_url'):
+            self.d_print('search url cached, skipping upload')
+            return cached['search_url']
+        with self.metrics.timer('upload'):
+            response = self.http.post(self.search_url, **self._upload_request(image))
+        return self._search_root(response.content)
+
+    @staticmethod
+    def _upload_request(image: Image.Image) -> dict:
+        """
+        Query parameters and multipart body of the image upload.
+        """
         content_type = 'image/jpeg'
         image_bytes = BytesIO()
         image.save(image_bytes, format='JPEG')
@@ -302,9 +751,16 @@ class Locator:
         files = {'upfile': ('blob', image_bytes, content_type)}
         params = {'rpt': 'imageview', 'format': 'json',
                   'request': '{"blocks":[{"block":"b-page_type_search-by-image__link"}]}'}
-        response = requests.post(self.search_url, params=params, files=files)
-        query_string = json.loads(response.content)['blocks'][0]['params']['url']
+        return {'params': params, 'files': files}
+
+    def _search_root(self, content: bytes) -> str:
+        """
+        Search URL from the upload response, remembered in the cache.
+        """
+        query_string = json.loads(content)['blocks'][0]['params']['url']
         img_search_url = self.search_url + '?' + query_string
+        if self.cache is not None:
+            self.cache.put(self.cache_key, search_url=img_search_url)
         return img_search_url
 
     def test_upload_image(self) -> str:
@@ -316,138 +772,495 @@ class Locator:
         self.d_print(img_search_url)
         return img_search_url
 
-    def get_image_link(self, page: any, link: any) -> [str, None]:
+    def _open_viewer(self, page: any, link: str) -> bool:
         """
-        This will evaluate the available image size links, and choose the best one.
+        Starts a page navigating to a viewer link without waiting for it to load, so several tabs can load at once.
         """
         self.d_print(link)
-        page.goto(link)
-        highest_resolution_url = None
         try:
-            page.wait_for_load_state("networkidle")
-            if self.find_selector(self.selectors['resolution_dropdown'], page):
-                page.click(self.selectors['resolution_dropdown'])
-                self.d_print('resolution links found')
-                resolution_dropdown = page.query_selector(self.selectors['resolution_links'])
-                resolution_links = resolution_dropdown.query_selector_all("li a")
-                highest_resolution = 0
-                highest_resolution_url = ""
-                for _link in resolution_links:
-                    resolution_text = _link.text_content()
-                    resolution = tuple(map(int, resolution_text.split('×')))
-                    if resolution[0] * resolution[1] > highest_resolution:
-                        highest_resolution = resolution[0] * resolution[1]
-                        highest_resolution_url = _link.get_attribute("href")
-                pass
+            page.goto(link, wait_until='commit')
+        except (TimeoutError, Error) as err:
+            self.d_print(f'unable to open {link}: {err}')
+            return False
+        return True
+
+    def get_image_link(self, page: any, link: any, opened: bool = False, attempts: int = 3) -> [str, None]:
+        """
+        This will evaluate the available image size links, and choose the best one.
+
+        Pass `opened` when the page has already been sent to the link with `_open_viewer`. Timeouts are retried up to
+        `attempts` times with the scheduler's backoff, as long as the deadline allows.
+        """
+        for attempt in range(attempts):
+            try:
+                if attempt or not opened:
+                    self.d_print(link)
+                    page.goto(link, wait_until='commit')
+                return self._read_viewer(page)
+            except TimeoutError:
+                delay = self.scheduler.backoff(attempt)
+                if attempt + 1 >= attempts or delay >= self.cutoff.remaining:
+                    break
+                self.metrics.count('retries')
+                self.d_print(f'retrying {link} in {delay:.2f}s')
+                time.sleep(delay)
+        self.d_print('max retries reached, aborting')
+        return None
+
+    def _read_viewer(self, page: any) -> [str, None]:
+        """
+        Reads the largest image URL off a viewer page that is loading, raises TimeoutError when it does not show up.
+        """
+        highest_resolution_url = None
+        page.wait_for_selector(
+            f"{self.selectors['resolution_dropdown']}, {self.selectors['open_button']}",
+            state='attached',
+            timeout=self.timeouts['viewer'],
+        )
+        if self.find_selector(self.selectors['resolution_dropdown'], page):
+            page.click(self.selectors['resolution_dropdown'], timeout=self.timeouts['viewer'])
+            self.d_print('resolution links found')
+            resolution_dropdown = page.wait_for_selector(
+                self.selectors['resolution_links'],
+                state='attached',
+                timeout=self.timeouts['viewer'],
+            )
+            resolution_links = resolution_dropdown.query_selector_all("li a")
+            highest_resolution = 0
+            highest_resolution_url = ""
+            for _link in resolution_links:
+                resolution_text = _link.text_content()
+                resolution = tuple(map(int, resolution_text.split('×')))
+                if resolution[0] * resolution[1] > highest_resolution:
+                    highest_resolution = resolution[0] * resolution[1]
+                    highest_resolution_url = _link.get_attribute("href")
+        else:
+            open_selection = page.query_selector(self.selectors['open_button'])
+            if open_selection:
+                self.d_print('found open')
+                highest_resolution_url = open_selection.get_attribute("href")
             else:
-                open_selection = page.query_selector(self.selectors['open_button'])
-                if open_selection:
-                    self.d_print('found open')
-                    highest_resolution_url = open_selection.get_attribute("href")
-                else:
-                    self.d_print('no resolution options were found')
-                pass
-            del self.retries[link]
-            return highest_resolution_url
-        except TimeoutError:
-            self.retries[link] += 1
-            if self.retries[link] < 4:
-                self.d_print('max retries reached, aborting')
-                del self.retries[link]
+                self.d_print('no resolution options were found')
+        return highest_resolution_url
+
+    def _get(self, url: str, **kwargs) -> any:
+        """
+        GET through the shared client, raising `Retry` for answers worth another attempt.
+        """
+        return check_status(self.http.get(url, **kwargs))
+
+    def _resolve_over_http(self, link: str) -> [str, None]:
+        """
+        Fetches a viewer page over the shared HTTP client and picks the largest image it lists, None when the page
+        does not give the sizes away without a browser.
+        """
+        with self.metrics.timer('resolve_http'):
+            try:
+                response = self.scheduler.run(
+                    link,
+                    self._get,
+                    link,
+                    headers={'User-Agent': 'Mozilla/5.0'},
+                    deadline=self.cutoff,
+                    metrics=self.metrics,
+                )
+            except Exception as err:  # noqa
+                self.d_print(f'unable to fetch viewer {link}: {err}')
+                return None
+            if response.status_code != 200:
                 return None
-            self.d_print(f'retrying download {link}')
-            self.get_image_link(page, link)
+            return largest(parse_viewer(response.text, link))
 
-    def download_image(self, image_url: str):
+    def iter_image_links(self, image_links: list) -> any:
         """
-        Aptly named.
+        Resolves viewer links, yielding each URL when ready.
+
+        Links we already resolved (see `cache`) are yielded first. The rest are fetched over plain HTTP by
+        `http_resolvers` threads and parsed, only the viewers that cannot be read that way are opened in the browser,
+        across a pool of tabs: every idle tab is sent to the next link straight away, so while we read one viewer the
+        others keep loading. `resolved_by` records which path resolved each link.
         """
-        self.threads += 1
-        if '127.0.0.1' not in image_url:
-            name = self.extract_filename_from_url(image_url)
-            if name is None:
-                filename = 'hidden'
-            else:
-                filename = name
-                if os.path.exists(os.path.join(self.save_folder, filename)):
-                    self.d_print(f"Skipping {filename}. File already exists.")
-                    self.returns += 1
-                    self.threads -= 1
-                    return None
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(image_url, headers=headers)
-            if response.status_code == 200:
-                if name is None:
-                    image_format = self.get_image_format(response.content)
-                    if image_format is None:
-                        self.d_print(f'skipping bad image: {image_url}')
-                        self.threads -= 1
-                        return None
-                    filename = f"{self.generate_md5(response.content)}.{image_format}"
+        known = [link for link in image_links if link in self.resolved]
+        pending = deque(link for link in image_links if link not in self.resolved)
+        fallback = deque()
+        active = deque()
+        pages = list()
+        idle = list()
+        futures = dict()
+        resolvers = None
+        if self.http_resolvers > 0 and pending:
+            resolvers = ThreadPoolExecutor(max_workers=self.http_resolvers)
+            futures = {resolvers.submit(self._resolve_over_http, link): link for link in pending}
+            pending = deque()
+        else:
+            fallback, pending = pending, deque()
+        try:
+            for link in known:
+                if self.term or self.quota.full:
+                    return
+                self.metrics.count('resolved.cache')
+                self.resolved_by[link] = 'cache'
+                yield self.resolved[link]
+            while futures or fallback or active:
+                if self.term or self.quota.full or self._expired():
+                    break
+                done = [future for future in futures if future.done()]
+                if not done and futures and not fallback and not active:
+                    done = [next(as_completed(futures))]
+                for future in done:
+                    link = futures.pop(future)
+                    url = future.result()
+                    if url is None:
+                        fallback.append(link)
+                        continue
+                    self.metrics.count('resolved.http')
+                    self.resolved[link] = url
+                    self.resolved_by[link] = 'http'
+                    yield url
+                if fallback and not pages:
+                    pages = [self._new_page() for _ in range(max(min(self.tabs, len(fallback)), 1))]
+                    idle = list(pages)
+                while idle and fallback:
+                    link = fallback.popleft()
+                    page = idle.pop()
+                    if self._open_viewer(page, link):
+                        active.append((page, link))
+                    else:
+                        idle.append(page)
+                if not active:
+                    continue
+                page, link = active.popleft()
+                with self.metrics.timer('resolve'):
+                    url = self.get_image_link(page, link, opened=True)
+                idle.append(page)
+                if url is not None:
+                    self.metrics.count('resolved.browser')
+                    self.resolved[link] = url
+                    self.resolved_by[link] = 'browser'
+                    yield url
+        finally:
+            if resolvers is not None:
+                resolvers.shutdown(wait=False, cancel_futures=True)
+            for page in pages:
+                try:
+                    page.close()
+                except Error:
                     pass
-                bad = False
-                image = Image.open(BytesIO(response.content))
-                image = featurecrop(np.array(image))
-                if self.deduplicate:
-                    try:
-                        image_array = np.array(image)
-                        bad = self._deduplicate(image_array)
-                        if bad:
-                            self.d_print(f'skipping duplicate image: {image_url}')
-                    except PIL.UnidentifiedImageError:
-                        self.d_print(f"Skipping unreadable image: {image_url}")
-                        bad = True
-                if not bad and self.returns < self.depth:
-                    self.returns += 1
-                    cv2.imwrite(os.path.join(self.save_folder, filename), cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-                    self.d_print(f"Downloaded {filename}")
-                    self.d_print('\nreturns\n', self.returns)
+            self._store_resolved()
 
-            else:
+    def resolve_image_links(self, image_links: list, callback: any = None) -> list:
+        """
+        Resolves viewer links across a pool of tabs, see `iter_image_links`.
+
+        Each resolved URL is handed to `callback` as soon as it is ready, returning False from the callback stops the
+        resolution.
+        """
+        result = list()
+        links = self.iter_image_links(image_links)
+        try:
+            for link in links:
+                result.append(link)
+                if callback is not None and callback(link) is False:
+                    break
+        finally:
+            links.close()
+        return result
+
+    def _fetch(self, image_url: str) -> [tuple, None]:
+        """
+        Streams an image through the shared client, returns its bytes and header info or None.
+        """
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        with self.metrics.timer('download'), self.http.stream(image_url, headers=headers) as response:
+            check_status(response)
+            if response.status_code != 200:
                 self.d_print(f"Failed to download {image_url}. Status code: {response.status_code}")
+                self.metrics.count('rejected.status')
+                return None
+            try:
+                content, info = read_image(response, self.max_bytes, self.max_pixels)
+                check_candidate(info, self.min_side, self.formats)
+            except Rejected as err:
+                self.d_print(f'skipping {image_url}: {err}')
+                self.metrics.count('rejected.fetch')
+                return None
+        self.metrics.count('bytes', len(content))
+        return content, info
+
+    def _probe(self, image_url: str) -> tuple:
+        """
+        Requests the first bytes of a candidate and checks its header, returns (keep, fetched).
+
+        `fetched` holds the bytes and header info when the probe happened to read the whole image, None otherwise.
+        """
+        headers = {'User-Agent': 'Mozilla/5.0', 'Range': f'bytes=0-{PROBE_SIZE - 1}'}
+        with self.metrics.timer('probe'), self.http.stream(image_url, headers=headers) as response:
+            check_status(response)
+            if response.status_code not in (200, 206):
+                self.d_print(f"Failed to probe {image_url}. Status code: {response.status_code}")
+                self.metrics.count('rejected.status')
+                return False, None
+            try:
+                content, info, complete = probe_image(
+                    response, self.max_bytes, self.max_pixels, self.min_side, self.formats
+                )
+            except Rejected as err:
+                self.d_print(f'skipping {image_url}: {err}')
+                self.metrics.count('rejected.probe')
+                return False, None
+        self.metrics.count('bytes', len(content))
+        if complete:
+            self.metrics.count('probe.complete')
+            return True, (content, info)
+        return True, None
+
+    def _download(self, image_url: str) -> [tuple, None]:
+        """
+        Probes (see `probe`) and fetches an image, returns its bytes and header info or None.
+        """
+        fetched = None
+        if self.probe:
+            keep, fetched = self._probe(image_url)
+            if not keep:
+                return None
+        if fetched is None:
+            fetched = self._fetch(image_url)
+        return fetched
+
+    def _gave_up(self, image_url: str, err: Exception):
+        """
+        Records why the scheduler dropped a URL.
+        """
+        if isinstance(err, DeadlineExceeded):
+            reason = 'deadline'
+        elif isinstance(err, HostUnavailable):
+            reason = 'circuit'
         else:
+            reason = 'retries'
+        self.d_print(f'giving up on {image_url}: {err}')
+        self.metrics.count(f'rejected.{reason}')
+
+    def download_image(self, image_url: str) -> [str, None]:
+        """
+        Aptly named.
+
+        Images are stored under the MD5 of their downloaded bytes and recorded in the folder's manifest, URLs and
+        byte-identical images we already hold are skipped before anything is decoded. The transfer goes through the
+        scheduler of the image's host. Returns the path of the stored image, None when nothing was stored.
+        """
+        skip, path = self._precheck(image_url)
+        if skip:
+            return path
+        try:
+            try:
+                fetched = self.scheduler.run(
+                    image_url,
+                    self._download,
+                    image_url,
+                    deadline=self.cutoff,
+                    metrics=self.metrics,
+                )
+            except (Retry, HostUnavailable) as err:
+                self._gave_up(image_url, err)
+                return None
+            if fetched is None:
+                return None
+            return self._store(image_url, *fetched)
+        finally:
+            self.manifest.release(image_url)
+
+    def _known(self, name: str) -> [str, None]:
+        """
+        A URL the folder already holds under `name` counts towards the depth like a new image would, returns its path
+        (None once the depth is reached).
+        """
+        self.metrics.count('rejected.known_url')
+        if not self.quota.take():
+            return None
+        return os.path.join(self.save_folder, name)
+
+    def _precheck(self, image_url: str) -> tuple:
+        """
+        Decides whether a URL needs downloading at all, returns (skip, path of the stored copy).
+
+        When it does the URL is claimed in the manifest, release it once the download is over.
+        """
+        if self.quota.full or self._expired():
+            return True, None
+        if '127.0.0.1' in image_url:
             self.d_print(f"skipping localhost redirect: {image_url}")
-        self.threads -= 1
-        return None
+            return True, None
+        manifest = self._load_manifest()
+        existing = manifest.find_url(image_url)
+        if existing is not None:
+            self.d_print(f"Skipping {existing}. Already downloaded from {image_url}.")
+            return True, self._known(existing)
+        if not manifest.claim(image_url):
+            return True, None
+        return False, None
 
-    def get_similar_images(self, page: any, depth: int = 4) -> list:
+    def _store(self, image_url: str, content: bytes, info: dict) -> [str, None]:
         """
-        This will locate similar images and return up to the number specified in the `depth` argument.
+        Decodes, crops, deduplicates and writes a downloaded image, returns its path or None when it was not kept.
+
+        The decoded pixels are a single read-only array handed from stage to stage without copies, and when
+        featurecrop leaves the image whole the downloaded bytes are written as they are instead of being re-encoded,
+        as long as they are in a format we keep (see `store.EXTENSIONS`), anything else is written as PNG. Images
+        decoded at reduced scale (see `decode_size`) are written at that scale, like their features, whether cropped or
+        not.
+        """
+        manifest = self._load_manifest()
+        digest = self.generate_md5(content)
+        if manifest.find_digest(digest) is not None or not manifest.claim(digest):  # Stored, or being stored right now.
+            self.d_print(f"skipping exact duplicate: {image_url}")
+            self.metrics.count('rejected.exact_duplicate')
+            return None
+        try:
+            filename = content_name(digest, info['format'])
+            bad = False
+            features = None
+            with self.metrics.timer('decode'):
+                decoded = np.asarray(decode_image(content, info, self.decode_size))  # Read-only, backed by PIL's bytes.
+            if self.processes > 0:
+                with self.metrics.timer('process'):
+                    image, features = self._process(decoded)
+            else:
+                with self.metrics.timer('featurecrop'):
+                    image = featurecrop(decoded)
+            image = np.asarray(image)
+            image.setflags(write=False)
+            verbatim = (
+                image.shape == decoded.shape and  # Not cropped,
+                image.shape[:2] == (info['height'], info['width']) and  # not decoded at reduced scale,
+                info['format'] in EXTENSIONS  # and not a format the name would call PNG.
+            )
+            del decoded
+            if self.deduplicate:
+                try:
+                    with self.metrics.timer('dedup'):
+                        if features is None:
+                            features = self._features(image)
+                        bad = self._deduplicate(image, filename, features)
+                    if bad:
+                        self.d_print(f'skipping duplicate image: {image_url}')
+                        self.metrics.count('rejected.duplicate')
+                except PIL.UnidentifiedImageError:
+                    self.d_print(f"Skipping unreadable image: {image_url}")
+                    self.metrics.count('rejected.unreadable')
+                    bad = True
+            if not bad and self.quota.take():
+                path = os.path.join(self.save_folder, filename)
+                with self.metrics.timer('write'):
+                    if verbatim:
+                        with open(path, 'wb') as file:
+                            file.write(content)
+                        self.metrics.count('written.original')
+                    else:
+                        cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+                width, height = (info['width'], info['height']) if verbatim else (image.shape[1], image.shape[0])
+                self.metrics.count('accepted')
+                if features is None and self.index is not None:
+                    features = self._features(image)
+                phash = perceptual_hash(Image.fromarray(image)) if features is None else features['phash']
+                manifest.add(filename, image_url, digest, width, height, phash)
+                if self.deduplicate:
+                    self.index.refresh(filename)
+                elif self.index is not None:
+                    self.index.add(filename, features)
+                if self.on_accept is not None:
+                    self.on_accept(ScoutResult(
+                        url=image_url,
+                        path=path,
+                        width=width,
+                        height=height,
+                        scores=features.get('scores', dict()) if self.deduplicate else dict(),
+                    ))
+                self.d_print(f"Downloaded {filename}")
+                self.d_print('\nreturns\n', self.returns)
+                return path
+            elif not bad:
+                self.metrics.count('rejected.quota')
+                if self.deduplicate:
+                    self.index.remove(filename)
+            return None
+        finally:
+            manifest.release(digest)
+
+    def _prepare(self, depth: int):
+        """
+        Resets the per scout state.
         """
-        self.returns = 0
         self.depth = depth
+        self.quota = Quota(depth)
         self.term = False
-        result = list()
+        if self.deduplicate:
+            self._load_index()
+        return self
+
+    def _expired(self) -> bool:
+        """
+        True once the deadline of the current scout has passed, the scout then winds down as if its quota was met.
+        """
+        if not self.cutoff.expired:
+            return False
+        if not self.quota.full:
+            self.d_print('deadline reached, returning what we have')
+            self.metrics.count('deadline')
+            self.quota.close()
+        return True
+
+    def _collect_similar_links(self, page: any) -> list:
+        """
+        Opens the similar images tab and collects the viewer links, or returns them from the cache.
+        """
+        if self.cached and self.cached['links'] is not None:
+            return list(self.cached['links'])
         image_links = list()
         button = self.selectors['similar_image_button']
-        page.wait_for_selector(button)
-        page.click(button)
-        page.wait_for_load_state('networkidle')
-        elements = page.query_selector_all('div a')
-        for element in elements:
-            link = element.get_attribute("href")
-            if link:
-                if '/images/search?' in link:
-                    url = f"{self.search_url}{link.replace('/images/search', '')}"
-                    image_links.append(url)
-        for image_link in image_links:
-            if self.term:
-                break
-            self.retries[image_link] = 0
-            link = self.get_image_link(page, image_link)
-            if link is not None:
-                result.append(link)
-                if self.returns >= depth:
-                    self.d_print('successfully located the requested image depth, operation complete')
-                    self.term = True
-                    break
-                while self.threads >= (self.depth - self.returns):
-                    if self.term or self.depth - self.returns == 0:
-                        return result
-                    time.sleep(0.1)
-                if not self.term:
-                    thread = Thread(target=self.download_image, args=(link, ), daemon=True)
-                    thread.start()
+        with self.metrics.timer('collect'):
+            page.wait_for_selector(button, timeout=self.timeouts['selector'])
+            before = len(page.query_selector_all(self.selectors['similar_links']))
+            page.click(button)
+            page.wait_for_function(  # The similar images have been rendered.
+                'args => document.querySelectorAll(args[0]).length > args[1]',
+                arg=[self.selectors['similar_links'], before],
+                timeout=self.timeouts['selector'],
+            )
+            elements = page.query_selector_all('div a')
+            for element in elements:
+                link = element.get_attribute("href")
+                if link:
+                    if '/images/search?' in link:
+                        url = f"{self.search_url}{link.replace('/images/search', '')}"
+                        image_links.append(url)
+        if self.cache is not None:
+            self.cache.put(self.cache_key, links=image_links)
+        return image_links
+
+    def get_similar_images(self, page: any, depth: int = 4) -> list:
+        """
+        This will locate similar images and return up to the number specified in the `depth` argument.
+
+        Links are resolved across a pool of tabs (Playwright is not thread safe, so this stays on the calling thread)
+        and fed through a bounded queue to the download workers, once `depth` images have been accepted the remaining
+        work is dropped and the workers shut down.
+        """
+        self._prepare(depth)
+        image_links = self._collect_similar_links(page)
+        pipeline = Pipeline(
+            handler=self.download_image,
+            workers=self.workers,
+            queue_size=self.queue_size,
+            stop=self.quota.reached,
+            ready=self.scheduler.ready,
+            debug=self.debug,
+        )
+        with pipeline:
+            result = self.resolve_image_links(image_links, callback=pipeline.put)
+        if self.quota.full and not self.cutoff.expired:
+            self.d_print('successfully located the requested image depth, operation complete')
+        if self.index is not None:
+            self.index.save()
         return result
 
     def test_similar_images(self):
@@ -465,23 +1278,310 @@ class Locator:
         )
         return result
 
-    def scout(self, image: [Path, np.ndarray, Image.Image], depth: int = 10):
+    def _start_metrics(self, source: str):
+        """
+        Fresh timers, counters and deadline for the scout of `source`.
+        """
+        self.cutoff = Deadline(self.deadline)
+        self.metrics = Metrics(self.sinks, source=source)
+        self.summary = None
+        return self.metrics
+
+    def _finish_metrics(self, links: [list, None] = None) -> ScoutLinks:
+        """
+        Reports the summary of the current scout to the sinks and attaches it to its links.
+        """
+        self.summary = self.metrics.finish()
+        result = ScoutLinks(links or list())
+        result.summary = self.summary
+        return result
+
+    def scout(self, image: [Path, np.ndarray, Image.Image], depth: int = 10) -> ScoutLinks:
         """
         Send a path, or image mat and discover similar images.
 
-        Gather to the number of images specified in the depth argument.
+        Gather to the number of images specified in the depth argument. The resolved links are returned with the
+        `summary` of the scout attached.
         """
         kwargs = {
             'depth': depth
         }
-        image = self._get_image_from_anything(image)
-        search_url = self.get_search_root(image)
-        result = self.init_web(
-            destination_url=search_url,
-            callback=self.get_similar_images,
-            **kwargs
+        self._start_metrics(self._source_key(image))
+        try:
+            image = self._get_image_from_anything(image)
+            search_url = self.get_search_root(image)
+            if search_url is None:
+                return self._finish_metrics(self.get_similar_images(None, depth))
+            result = self.init_web(
+                destination_url=search_url,
+                callback=self.get_similar_images,
+                **kwargs
+            )
+            return self._finish_metrics(result)
+        finally:
+            self._retire()
+
+    def _upload(self, image: [Path, np.ndarray, Image.Image, str]) -> [str, None]:
+        """
+        Starts the scout of a `scout_many` child: fresh metrics and deadline, then loads the source and uploads it.
+        Returns the search URL (None when the results are cached).
+        """
+        self._start_metrics(self.key)
+        return self.get_search_root(self._get_image_from_anything(image))
+
+    def _source_key(self, image: [Path, np.ndarray, Image.Image, str]) -> str:
+        """
+        Stable name for a source, used as the key of the `scout_many` result map.
+        """
+        if isinstance(image, Path):
+            return image.expanduser().resolve().as_posix()
+        if isinstance(image, str):
+            if re.match(r'^https?://.+', image):
+                return image
+            return Path(image).expanduser().resolve().as_posix()
+        if isinstance(image, Image.Image):
+            image = np.asarray(image)
+        if isinstance(image, np.ndarray):
+            return f"array-{self.generate_md5(np.ascontiguousarray(image).tobytes())}"
+        raise TypeError(f'unable to locate image from {type(image)}')
+
+    def _open_folder(self):
+        """
+        Opens the manifest and index of the save folder, so children spawned to share them find them open.
+        """
+        with self.lock:
+            self._load_manifest()
+            if self.deduplicate:
+                self._load_index()
+        return self
+
+    def _close_folder(self):
+        """
+        Closes the manifest of the save folder, for a child whose folder was its own once its scout is over.
+        """
+        with self.lock:
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+        return self
+
+    def _spawn(self, key: str, shared: bool = False) -> 'Locator':
+        """
+        A child locator for one source, it shares our models, browser pool, process pool and settings.
+
+        The children of a batch get a folder of their own under ours, `shared` children use our folder, index and
+        manifest instead (see `_open_folder`). Call `_retire` on it once its scout is over, and `_close_folder` when
+        the folder was its own.
+        """
+        if self.processes > 0:
+            self._stage()  # Before the copy, so every child shares our pool.
+        child = copy.copy(self)
+        child.key = key
+        if not shared:
+            name = re.sub(r'[^\w.-]+', '_', key.rsplit('/', 1)[-1]).lower()[-64:] or 'source'
+            root = self.save_folder or '.'
+            child.save_folder = os.path.join(root, f"{name}_{self.generate_md5(key.encode())[:8]}_images")
+            child.index = None
+            child.manifest = None
+        child.context = None
+        child.mat = None
+        child.lock = threading.RLock()
+        child.source_features = None
+        child.cache_key = None
+        child.cached = None
+        child.resolved = dict()
+        child.resolved_by = dict()
+        child.metrics = Metrics(self.sinks, source=key)
+        child.cutoff = Deadline(self.deadline)
+        child.summary = None
+        child.quota = Quota(0)
+        child.term = False
+        child.owns_session = False
+        if self.deduplicate:
+            child.batcher = child._make_batcher()
+        return child
+
+    @staticmethod
+    def _load_state(state_file: [str, None]) -> dict:
+        """
+        Reads the progress of an earlier `scout_many` run.
+        """
+        if not state_file or not os.path.isfile(state_file):
+            return dict()
+        with open(state_file, 'r') as file:
+            return json.load(file)
+
+    @staticmethod
+    def _save_state(state_file: [str, None], state: dict):
+        """
+        Writes the progress of a `scout_many` run.
+        """
+        if not state_file:
+            return
+        temp_file = f'{state_file}.tmp'
+        with open(temp_file, 'w') as file:
+            json.dump(state, file, indent=2)
+        os.replace(temp_file, state_file)
+
+    def _feed_batch(self, page: any, pipeline: Pipeline, tracker: dict) -> list:
+        """
+        Resolves this source's links and queues them on the shared batch pipeline.
+        """
+        def enqueue(link: str) -> bool:
+            with tracker['lock']:
+                tracker['pending'][self] = tracker['pending'].get(self, 0) + 1
+            if pipeline.put((self, link)):
+                return True
+            tracker['done'](self)
+            return False
+
+        return self.resolve_image_links(self._collect_similar_links(page), callback=enqueue)
+
+    def scout_many(
+            self,
+            images: any,
+            depth: int = 10,
+            state_file: [str, None] = None,
+            upload_workers: int = 4,
+    ) -> dict:
+        """
+        Scout a whole collection of sources (anything `scout` accepts) sharing one browser pool and one download pool.
+
+        Uploads run `upload_workers` at a time, viewer pages are resolved on this thread as soon as each upload lands,
+        and the downloads of every source share the `workers` pool so they overlap with the next source's browser work.
+        Returns a map of source key to resolved links, or to the exception that source raised. With a `state_file`
+        finished sources are recorded as they complete and skipped (their stored links returned) on the next run.
+        """
+        state = self._load_state(state_file)
+        results = dict()
+        lock = threading.Lock()
+        tracker = {'lock': lock, 'pending': dict(), 'resolved': set()}
+
+        def finish(child: Locator):
+            with lock:
+                if child not in tracker['resolved'] or tracker['pending'].get(child, 0) > 0:
+                    return
+                tracker['resolved'].discard(child)
+                if child.index is not None:
+                    child.index.save()
+                child._retire()
+                child._close_folder()
+                links = results.get(child.key)
+                if isinstance(links, list):
+                    results[child.key] = links = child._finish_metrics(links)
+                    state[child.key] = {'status': 'done', 'folder': child.save_folder, 'links': links}
+                    self._save_state(state_file, state)
+
+        def done(child: Locator):
+            with lock:
+                tracker['pending'][child] -= 1
+            finish(child)
+
+        def download(item: tuple):
+            child, link = item
+            try:
+                child.download_image(link)
+            finally:
+                done(child)
+
+        tracker['done'] = done
+        owns_session = self.session is None
+        if owns_session:
+            self.session = SessionPool(http=self.http, debug=self.debug).start()
+        pipeline = Pipeline(
+            handler=download,
+            workers=self.workers,
+            queue_size=self.queue_size,
+            ready=lambda item: self.scheduler.ready(item[1]),
+            debug=self.debug,
         )
-        return result
+        try:
+            with pipeline, ThreadPoolExecutor(max_workers=max(upload_workers, 1)) as uploads:
+                futures = dict()
+                for image in images:
+                    key = self._source_key(image)
+                    if state.get(key, dict()).get('status') == 'done':
+                        self.d_print(f'skipping finished source {key}')
+                        results[key] = state[key]['links']
+                        continue
+                    child = self._spawn(key)
+                    futures[uploads.submit(child._upload, image)] = child
+                for future in as_completed(futures):
+                    child = futures[future]
+                    try:
+                        search_url = future.result()
+                        child._prepare(depth)
+                        if search_url is None:
+                            results[child.key] = child._feed_batch(None, pipeline, tracker)
+                        else:
+                            results[child.key] = child.init_web(
+                                destination_url=search_url,
+                                callback=child._feed_batch,
+                                pipeline=pipeline,
+                                tracker=tracker,
+                            )
+                    except Exception as err:  # noqa
+                        self.d_print(f'unable to scout {child.key}: {err}')
+                        results[child.key] = err
+                        state[child.key] = {'status': 'failed', 'error': str(err)}
+                        with lock:
+                            self._save_state(state_file, state)
+                    with lock:
+                        tracker['resolved'].add(child)
+                    finish(child)
+        finally:
+            if owns_session:
+                self.session.close()
+                self.session = None
+        return results
+
+    def iter_scout(self, image: [Path, np.ndarray, Image.Image, str], depth: int = 10) -> any:
+        """
+        Like `scout`, but yields a `ScoutResult` for every image as soon as it has been written.
+
+        The browser is driven from the thread iterating the generator. Stopping early (break, or closing the generator)
+        cancels the outstanding work: nothing else is written and the download workers are shut down. The summary of
+        the scout is left in `summary` once the generator finishes.
+        """
+        key = self._source_key(image)
+        try:
+            self._start_metrics(key)
+            image = self._get_image_from_anything(image)
+            search_url = self.get_search_root(image)
+            self._prepare(depth)
+            accepted = queue.Queue()
+            self.on_accept = accepted.put
+            pipeline = Pipeline(
+                handler=self.download_image,
+                workers=self.workers,
+                queue_size=self.queue_size,
+                stop=self.quota.reached,
+                ready=self.scheduler.ready,
+                debug=self.debug,
+            )
+            page_context = nullcontext() if search_url is None else self.web_page(search_url)
+            with page_context as page, pipeline:
+                links = self.iter_image_links(self._collect_similar_links(page))
+                try:
+                    for link in links:
+                        while not accepted.empty():
+                            yield accepted.get_nowait()
+                        if not pipeline.put(link):
+                            break
+                    while pipeline.busy or not accepted.empty():
+                        try:
+                            yield accepted.get(timeout=0.1)
+                        except queue.Empty:
+                            continue
+                finally:
+                    self.quota.close()  # Cancel before the workers are joined.
+                    links.close()
+        finally:
+            self.on_accept = None
+            if self.index is not None:
+                self.index.save()
+            self._finish_metrics()
+            self._retire()
 
     def test_scout(self):
         """
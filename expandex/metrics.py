@@ -0,0 +1,229 @@
+"""
+Stage timers, counters and the sinks they are reported to.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+
+@dataclass
+class ScoutSummary:
+    """
+    What one scout spent its time on: per stage call counts and seconds, plus counters (bytes, accepted, rejected.*,
+    retries...).
+    """
+    source: str
+    elapsed: float = 0.0
+    stages: dict = field(default_factory=dict)
+    counters: dict = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        """
+        The summary as plain, JSON serialisable data.
+        """
+        return asdict(self)
+
+
+def _escape(value: any) -> str:
+    """
+    A Prometheus label value with its backslashes, double quotes and line feeds escaped.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CallbackSink:
+    """
+    Hands every event to a callable.
+    """
+    def __init__(self, callback: any):
+        self.callback = callback
+
+    def emit(self, event: dict):
+        """
+        Passes an event on as is.
+        """
+        self.callback(event)
+
+    def flush(self, summary: ScoutSummary):
+        """
+        Passes the summary on as a `summary` event.
+        """
+        self.callback({'type': 'summary', **summary.as_dict()})
+
+
+class JsonLinesSink:
+    """
+    Appends every event, and the summary of every scout, to a JSON lines file.
+    """
+    def __init__(self, path: str, events: bool = True):
+        self.path = path
+        self.events = events
+        self.lock = threading.Lock()
+
+    def _write(self, record: dict):
+        """
+        Appends one record as a line of JSON.
+        """
+        with self.lock:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(record) + '\n')
+
+    def emit(self, event: dict):
+        """
+        Writes the event, unless the sink was asked for summaries only.
+        """
+        if self.events:
+            self._write(event)
+
+    def flush(self, summary: ScoutSummary):
+        """
+        Writes the summary as a `summary` record.
+        """
+        self._write({'type': 'summary', **summary.as_dict()})
+
+
+class PrometheusSink:
+    """
+    Accumulates the stage timers and counters of every scout and renders them in the Prometheus text format.
+
+    With a `path` the text is rewritten after every scout, ready for the node exporter's textfile collector.
+    """
+    def __init__(self, path: [str, None] = None, prefix: str = 'expandex'):
+        self.path = path
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.seconds = dict()
+        self.calls = dict()
+        self.counters = dict()
+        self.scouts = 0
+
+    def emit(self, event: dict):
+        """
+        Ignored, everything we need arrives with the summary.
+        """
+        pass
+
+    def flush(self, summary: ScoutSummary):
+        """
+        Adds the summary to the running totals and rewrites `path`, if there is one.
+        """
+        with self.lock:
+            self.scouts += 1
+            for stage, timing in summary.stages.items():
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + timing['seconds']
+                self.calls[stage] = self.calls.get(stage, 0) + timing['count']
+            for name, value in summary.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+        if self.path:
+            temp_file = f'{self.path}.tmp'
+            with open(temp_file, 'w') as file:
+                file.write(self.render())
+            os.replace(temp_file, self.path)
+
+    def render(self) -> str:
+        """
+        The accumulated metrics in the Prometheus text exposition format.
+        """
+        prefix = self.prefix
+        with self.lock:
+            lines = [
+                f'# HELP {prefix}_scouts_total Scouts completed.',
+                f'# TYPE {prefix}_scouts_total counter',
+                f'{prefix}_scouts_total {self.scouts}',
+                f'# HELP {prefix}_stage_seconds_total Time spent in each pipeline stage.',
+                f'# TYPE {prefix}_stage_seconds_total counter',
+            ]
+            lines += [
+                f'{prefix}_stage_seconds_total{{stage="{_escape(s)}"}} {v:.6f}' for s, v in sorted(self.seconds.items())
+            ]
+            lines += [
+                f'# HELP {prefix}_stage_calls_total Calls of each pipeline stage.',
+                f'# TYPE {prefix}_stage_calls_total counter',
+            ]
+            lines += [f'{prefix}_stage_calls_total{{stage="{_escape(s)}"}} {v}' for s, v in sorted(self.calls.items())]
+            lines += [
+                f'# HELP {prefix}_events_total Bytes downloaded, images accepted and rejected, retries.',
+                f'# TYPE {prefix}_events_total counter',
+            ]
+            lines += [f'{prefix}_events_total{{name="{_escape(n)}"}} {v}' for n, v in sorted(self.counters.items())]
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """
+    Thread safe timers and counters for one scout.
+
+    Sinks are objects with `emit(event)` and `flush(summary)` (see the classes above), plain callables are wrapped in a
+    `CallbackSink`. Events are emitted as they happen, the summary once the scout is finished.
+    """
+    def __init__(self, sinks: [list, None] = None, source: str = ''):
+        self.sinks = [sink if hasattr(sink, 'emit') else CallbackSink(sink) for sink in sinks or list()]
+        self.source = source
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = dict()
+        self.counters = dict()
+
+    def _emit(self, event: dict):
+        """
+        Tags an event with the source and hands it to every sink.
+        """
+        event['source'] = self.source
+        for sink in self.sinks:
+            sink.emit(event)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Times the body of a with block as one call of `stage`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        """
+        Adds one call of `stage` that took `seconds`.
+        """
+        with self.lock:
+            timing = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+            timing['count'] += 1
+            timing['seconds'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+        if self.sinks:
+            self._emit({'type': 'timer', 'stage': stage, 'seconds': seconds})
+
+    def count(self, name: str, value: int = 1):
+        """
+        Adds `value` to the counter `name`.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.sinks:
+            self._emit({'type': 'counter', 'name': name, 'value': value})
+
+    def summary(self) -> ScoutSummary:
+        """
+        A snapshot of the timers and counters so far.
+        """
+        with self.lock:
+            return ScoutSummary(
+                source=self.source,
+                elapsed=time.perf_counter() - self.started,
+                stages={stage: dict(timing) for stage, timing in self.stages.items()},
+                counters=dict(self.counters),
+            )
+
+    def finish(self) -> ScoutSummary:
+        """
+        Builds the summary and hands it to every sink.
+        """
+        summary = self.summary()
+        for sink in self.sinks:
+            sink.flush(summary)
+        return summary
@@ -0,0 +1,259 @@
+"""
+Shared keep-alive HTTP layer.
+"""
+import weakref
+import threading
+import cloudscraper
+from contextlib import contextmanager, asynccontextmanager
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2  # noqa
+except ImportError:
+    h2 = None
+
+
+class LockedCookieJar(RequestsCookieJar):
+    """
+    A cookie jar every thread of the shared session can read while others write to it.
+
+    Writes already go through the jar's own lock, iterating takes it too and walks a snapshot. `version` changes with
+    every write, so readers can tell when there is nothing new to copy.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __iter__(self):
+        with self._cookies_lock:
+            return iter(list(super().__iter__()))
+
+    def set_cookie(self, cookie: any, *args, **kwargs):
+        """
+        Stores a cookie.
+        """
+        with self._cookies_lock:
+            self.version += 1
+            return super().set_cookie(cookie, *args, **kwargs)
+
+    def clear(self, domain: [str, None] = None, path: [str, None] = None, name: [str, None] = None):
+        """
+        Drops every cookie, or those of `domain`, `path` and `name`.
+        """
+        with self._cookies_lock:
+            self.version += 1
+            return super().clear(domain, path, name)
+
+
+class StreamResponse:
+    """
+    Gives an httpx streaming response the handful of requests attributes the download code uses.
+    """
+    def __init__(self, response: any):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def iter_content(self, chunk_size: int = 65536):
+        """
+        The body in chunks of up to `chunk_size` bytes, read as they are asked for.
+        """
+        return self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        """
+        Gives the connection back to the pool, whatever is left of the body is dropped.
+        """
+        self.response.close()
+
+
+class HttpClient:
+    """
+    One thread safe HTTP client shared by everything that touches the network.
+
+    It is built on a cloudscraper session, so the cookies it earns are reused by every request (and handed to the
+    browser), with connection pools of `pool_maxsize` kept alive per host. When httpx and h2 are installed and `http2`
+    is set, image downloads go over a pooled HTTP/2 client carrying the same cookies. The session's cookie jar is a
+    `LockedCookieJar`, so the worker threads sharing it never see it change under them.
+    """
+    def __init__(
+            self,
+            pool_connections: int = 16,
+            pool_maxsize: int = 32,
+            timeout: float = 30.0,
+            http2: bool = True,
+            debug: bool = False,
+    ):
+        self.timeout = timeout
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.scraper = cloudscraper.create_scraper()
+        self.scraper.cookies = LockedCookieJar()
+        self.synced = weakref.WeakKeyDictionary()  # httpx client: jar version it was last given.
+        self.scraper.mount('https://', cloudscraper.CipherSuiteAdapter(  # Keeps the scraper's TLS fingerprint.
+            cipherSuite=self.scraper.cipherSuite,
+            ecdhCurve=self.scraper.ecdhCurve,
+            ssl_context=self.scraper.ssl_context,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        ))
+        self.scraper.mount('http://', HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize))
+        self.h2 = None
+        if http2 and httpx is not None and h2 is not None:
+            self.h2 = httpx.Client(
+                http2=True,
+                timeout=timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=pool_connections * pool_maxsize,
+                    max_keepalive_connections=pool_maxsize,
+                ),
+            )
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Drops every pooled connection.
+        """
+        self.scraper.close()
+        if self.h2 is not None:
+            self.h2.close()
+        return self
+
+    def get(self, url: str, **kwargs) -> any:
+        """
+        GET through the cloudscraper session, with our timeout unless one is given.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.scraper.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> any:
+        """
+        POST through the cloudscraper session, with our timeout unless one is given.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.scraper.post(url, **kwargs)
+
+    def browser_cookies(self, url: str) -> list:
+        """
+        Visits `url` through cloudscraper and returns its cookies in the shape Playwright expects.
+        """
+        response = self.get(url)
+        cookies = list()
+        for c in response.cookies:
+            name, value, domain = c.name, c.value, c.domain
+            cookie = {"name": name, "value": value, "domain": domain, 'path': '/'}
+            self.d_print(cookie)
+            cookies.append(cookie)
+        return cookies
+
+    def _sync_cookies(self, client: any = None):
+        """
+        Copies the cloudscraper cookies over to an httpx client (the HTTP/2 one by default), unless the jar has not
+        changed since that client was last given them.
+        """
+        client = client or self.h2
+        jar = self.scraper.cookies
+        with self.lock:
+            version = jar.version
+            if self.synced.get(client) == version:
+                return
+            for c in jar:
+                client.cookies.set(c.name, c.value, domain=c.domain, path=c.path)
+            self.synced[client] = version
+
+    @contextmanager
+    def stream(self, url: str, headers: [dict, None] = None):
+        """
+        Streaming GET, the body is only read as the caller iterates over it.
+        """
+        if self.h2 is not None:
+            self._sync_cookies()
+            with self.h2.stream('GET', url, headers=headers) as response:
+                yield StreamResponse(response)
+            return
+        response = self.scraper.get(url, headers=headers, stream=True, timeout=self.timeout)
+        try:
+            yield response
+        finally:
+            response.close()
+
+
+class AsyncHttpClient:
+    """
+    The asyncio counterpart of `HttpClient`, a pooled httpx.AsyncClient (HTTP/2 when h2 is installed).
+
+    It is paired with an `HttpClient` whose cloudscraper cookies are copied over before every request, so both share
+    whatever the scraper has earned.
+    """
+    def __init__(
+            self,
+            http: HttpClient,
+            pool_maxsize: int = 32,
+            timeout: float = 30.0,
+            http2: bool = True,
+            debug: bool = False,
+    ):
+        if httpx is None:
+            raise ImportError('AsyncHttpClient needs httpx, pip install httpx[http2]')
+        self.http = http
+        self.timeout = timeout
+        self.debug = debug
+        self.client = httpx.AsyncClient(
+            http2=http2 and h2 is not None,
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=pool_maxsize * 4, max_keepalive_connections=pool_maxsize),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Drops every pooled connection.
+        """
+        await self.client.aclose()
+        return self
+
+    async def get(self, url: str, **kwargs) -> any:
+        """
+        GET carrying the cookies of the paired `HttpClient`.
+        """
+        self.http._sync_cookies(self.client)
+        return await self.client.get(url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> any:
+        """
+        POST carrying the cookies of the paired `HttpClient`.
+        """
+        self.http._sync_cookies(self.client)
+        return await self.client.post(url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: [dict, None] = None):
+        """
+        Streaming GET, read the body with `aiter_bytes`.
+        """
+        self.http._sync_cookies(self.client)
+        async with self.client.stream('GET', url, headers=headers) as response:
+            yield response
@@ -0,0 +1,168 @@
+"""
+Bounded producer/consumer plumbing for the download stage.
+"""
+import queue
+import threading
+
+SENTINEL = object()
+DEFER_PAUSE = 0.01  # Seconds a worker rests after putting back work that could not start yet.
+
+
+class Quota:
+    """
+    Thread safe cap on the number of accepted images.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+        self.lock = threading.Lock()
+        self.reached = threading.Event()
+        if self.limit <= 0:
+            self.reached.set()
+
+    @property
+    def full(self) -> bool:
+        """
+        True once the limit is met or the quota was closed.
+        """
+        return self.reached.is_set()
+
+    def take(self) -> bool:
+        """
+        Claims a slot, returns False once the quota has been met.
+        """
+        with self.lock:
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            if self.count >= self.limit:
+                self.reached.set()
+            return True
+
+    def close(self):
+        """
+        Cancels the quota, no further slots will be handed out.
+        """
+        with self.lock:
+            self.limit = self.count
+            self.reached.set()
+        return self
+
+
+class Pipeline:
+    """
+    A bounded queue feeding a fixed pool of worker threads.
+
+    `put` blocks while the queue is full so the producer can never run too far ahead of the workers, and once `stop` is
+    set any queued work is dropped rather than processed. Items for which `ready` returns False are moved to the back of
+    the queue while there is other work to do, so the workers are not tied up waiting on a busy host.
+    """
+    def __init__(
+            self,
+            handler: any,
+            workers: int = 8,
+            queue_size: int = 16,
+            stop: [threading.Event, None] = None,
+            ready: any = None,
+            debug: bool = False,
+    ):
+        self.handler = handler
+        self.workers = max(int(workers), 1)
+        self.queue = queue.Queue(maxsize=max(int(queue_size), 1))
+        self.stop = stop if stop is not None else threading.Event()
+        self.ready = ready
+        self.debug = debug
+        self.threads = list()
+        self.lock = threading.Lock()
+        self.closing = False
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.stop.set()
+        self.close()
+
+    @property
+    def busy(self) -> bool:
+        """
+        True while anything is queued or being worked on.
+        """
+        return self.queue.unfinished_tasks > 0
+
+    def start(self):
+        """
+        Spins up the worker pool.
+        """
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'expandex-worker-{idx}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def put(self, item: any) -> bool:
+        """
+        Queues work, waiting for room. Returns False if the pipeline was stopped first.
+        """
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _work(self):
+        """
+        Worker loop.
+        """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is SENTINEL:
+                    break
+                if self.stop.is_set():
+                    continue
+                if self.ready is not None and not self.ready(item) and self._defer(item):
+                    self.stop.wait(DEFER_PAUSE)
+                    continue
+                self.handler(item)
+            except Exception as err:  # noqa
+                self.d_print(f'worker failed on {item}: {err}')
+            finally:
+                self.queue.task_done()
+
+    def _defer(self, item: any) -> bool:
+        """
+        Puts an item back at the end of the queue, False when it should run now: nothing else is queued, the queue is
+        full or the pipeline is closing (the item would land behind the sentinels).
+        """
+        with self.lock:
+            if self.closing or self.queue.empty():
+                return False
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                return False
+            return True
+
+    def close(self):
+        """
+        Lets the workers finish what is queued (or drop it once stopped) and waits for them to exit.
+        """
+        with self.lock:
+            self.closing = True
+        for _ in self.threads:
+            self.queue.put(SENTINEL)
+        for thread in self.threads:
+            thread.join()
+        self.threads = list()
+        return self
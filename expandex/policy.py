@@ -0,0 +1,93 @@
+"""
+What the browser pages are allowed to load.
+"""
+from urllib.parse import urlparse
+from playwright._impl._errors import Error  # noqa
+
+BLOCKED_TYPES = ('image', 'media', 'font')
+
+BLOCKED_HOSTS = (
+    'mc.yandex.ru',
+    'mc.yandex.com',
+    'an.yandex.ru',
+    'yandexadexchange.net',
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'top-fwz1.mail.ru',
+)  # Analytics and ads.
+
+
+class ResourcePolicy:
+    """
+    Aborts the requests a page makes for resource types in `resource_types` (Playwright's names: image, media, font,
+    stylesheet...) and for anything served from `hosts` or their subdomains, everything else goes through.
+
+    Nothing we read from the search, similar images or viewer pages needs thumbnails, fonts or trackers, and dropping
+    them lets every navigation settle sooner.
+    """
+    def __init__(self, resource_types: tuple = BLOCKED_TYPES, hosts: tuple = BLOCKED_HOSTS, debug: bool = False):
+        self.resource_types = set(resource_types)
+        self.hosts = tuple(hosts)
+        self.debug = debug
+        self.blocked = 0
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        """
+        True for requests of a blocked resource type, or to a blocked host or one of its subdomains.
+        """
+        if resource_type in self.resource_types:
+            return True
+        host = urlparse(url).hostname or ''
+        return any(host == blocked or host.endswith(f'.{blocked}') for blocked in self.hosts)
+
+    def handle(self, route: any):
+        """
+        Route handler, see `apply`.
+        """
+        request = route.request
+        try:
+            if self.blocks(request.resource_type, request.url):
+                self.blocked += 1
+                route.abort()
+            else:
+                route.continue_()
+        except Error as err:  # The page went away while the request was in flight.
+            self.d_print(f'unable to route {request.url}: {err}')
+
+    async def handle_async(self, route: any):
+        """
+        `handle` for pages of the Playwright async API.
+        """
+        request = route.request
+        try:
+            if self.blocks(request.resource_type, request.url):
+                self.blocked += 1
+                await route.abort()
+            else:
+                await route.continue_()
+        except Error as err:
+            self.d_print(f'unable to route {request.url}: {err}')
+
+    def apply(self, page: any) -> any:
+        """
+        Installs the policy on a page, returns the page.
+        """
+        if self.resource_types or self.hosts:
+            page.route('**/*', self.handle)
+        return page
+
+    async def apply_async(self, page: any) -> any:
+        """
+        `apply` for pages of the Playwright async API.
+        """
+        if self.resource_types or self.hosts:
+            await page.route('**/*', self.handle_async)
+        return page
@@ -0,0 +1,189 @@
+"""
+Browser free parsing of viewer pages.
+"""
+import re
+import json
+import html
+from urllib.parse import urlparse, parse_qs
+
+SIZE_LINK = re.compile(r'<a\b[^>]*?href="([^"]+)"[^>]*>\s*(\d+)\s*[×xX]\s*(\d+)\s*</a>', re.S)
+STATE_ATTRIBUTE = re.compile(r'\bdata-state="([^"]*)"')
+STATE_SCRIPT = re.compile(r'<script\b[^>]*>\s*(\{.*?\})\s*</script>', re.S)
+ORIGIN_KEYS = ('img_href', 'origUrl', 'originalUrl')
+SIZE_KEYS = (('w', 'h'), ('width', 'height'))
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.jpe', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff', '.avif', '.heic', '.jfif')
+PREVIEW_HOSTS = ('yandex.net', 'yandex.ru', 'yandex.com')  # Thumbnails and previews, never the original.
+SIZE_MENU = 'OpenImageButton_sizes'  # Class of the viewed image's sizes menu, see `Locator.selectors`.
+
+
+def _absolute(url: str) -> [str, None]:
+    """
+    `url` with a scheme when it is an http(s) URL that is not one of our previews, else None.
+    """
+    if url.startswith('//'):
+        url = f'https:{url}'
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return None
+    if parsed.hostname.endswith(PREVIEW_HOSTS):
+        return None
+    return url
+
+
+def _image_url(url: any, strict: bool = True) -> [str, None]:
+    """
+    `url` made absolute when it can point at an image: with an image extension, or with none at all unless `strict`.
+    """
+    if not isinstance(url, str):
+        return None
+    url = _absolute(url)
+    if url is None:
+        return None
+    name = urlparse(url).path.rsplit('/', 1)[-1].lower()
+    if name.endswith(IMAGE_SUFFIXES):
+        return url
+    if strict or '.' in name:
+        return None
+    return url
+
+
+def _elements(text: str, class_name: str) -> list:
+    """
+    The markup of every element carrying `class_name`, from its opening tag to the matching closing one.
+    """
+    elements = list()
+    opening = re.compile(rf'<(\w+)\b[^>]*\bclass="[^"]*(?<![\w-]){re.escape(class_name)}(?![\w-])[^"]*"[^>]*>')
+    for match in opening.finditer(text):
+        depth = 1
+        for tag in re.compile(rf'<(/?){match.group(1)}\b[^>]*>').finditer(text, match.end()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                elements.append(text[match.start():tag.end()])
+                break
+    return elements
+
+
+def _size_links(text: str, img_url: [str, None]) -> list:
+    """
+    (width, height, url) candidates from the sizes menu of the viewed image. The size links of any other item on the
+    page are ignored, and when the page carries several menus only those linking to `img_url` are read.
+    """
+    menus = [menu for menu in _elements(text, SIZE_MENU) if SIZE_LINK.search(menu)]
+    if len(menus) > 1:
+        menus = [menu for menu in menus if any(html.unescape(url) == img_url for url, _, _ in SIZE_LINK.findall(menu))]
+    candidates = list()
+    for menu in menus:
+        for url, width, height in SIZE_LINK.findall(menu):
+            url = _image_url(html.unescape(url), strict=False)
+            if url:
+                candidates.append((int(width), int(height), url))
+    return candidates
+
+
+def viewed_item(link: [str, None]) -> tuple:
+    """
+    The (img_url, pos) a viewer link points at, either may be None.
+    """
+    if not link:
+        return None, None
+    query = parse_qs(urlparse(html.unescape(link)).query)
+    img_url = query.get('img_url', [None])[0]
+    pos = query.get('pos', [None])[0]
+    return img_url, pos
+
+
+def _states(text: str) -> list:
+    """
+    The JSON state trees embedded in a page, in `data-state` attributes and inline scripts.
+    """
+    states = list()
+    for blob in STATE_ATTRIBUTE.findall(text) + STATE_SCRIPT.findall(text):
+        try:
+            states.append(json.loads(html.unescape(blob)))
+        except ValueError:
+            continue
+    return states
+
+
+def _walk(node: any, item: [dict, None] = None) -> any:
+    """
+    Yields every object in `node` with the closest object at or above it carrying a `pos`, its item.
+    """
+    if isinstance(node, dict):
+        if 'pos' in node:
+            item = node
+        yield node, item
+        for value in node.values():
+            yield from _walk(value, item)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value, item)
+
+
+def _find_item(states: list, img_url: [str, None], pos: [str, None]) -> [dict, None]:
+    """
+    The object describing the viewed image: the one whose original URL is `img_url`, else the one at `pos`.
+    """
+    if img_url:
+        for state in states:
+            for node, item in _walk(state):
+                if any(node.get(key) == img_url for key in ORIGIN_KEYS):
+                    return node if item is None else item
+                if node.get('url') == img_url:
+                    return node if item is None else item
+    if pos is not None:
+        for state in states:
+            for node, _ in _walk(state):
+                if str(node.get('pos')) == pos:
+                    return node
+    return None
+
+
+def parse_viewer(text: str, link: [str, None] = None) -> list:
+    """
+    Collects (width, height, url) candidates for the image a viewer page shows: the entries of its sizes menu when it
+    is rendered server side, and the URLs with dimensions found under the object of the JSON state embedded in the page
+    that describes the image `link` points at (by its `img_url`, then its `pos`). Original image URLs found without
+    dimensions are listed as 0x0. The other items of the page (related images, carousels) are ignored, so is any URL
+    that does not look like an image.
+    """
+    img_url, pos = viewed_item(link)
+    candidates = _size_links(text, img_url)
+    item = _find_item(_states(text), img_url, pos)
+    if item is None:
+        return candidates
+    for node, _ in _walk(item):
+        for key in ('url',) + ORIGIN_KEYS:
+            url = _image_url(node.get(key), strict=key == 'url')  # A bare `url` is as likely to be a page.
+            if url is None:
+                continue
+            for width_key, height_key in SIZE_KEYS:
+                width, height = node.get(width_key), node.get(height_key)
+                if isinstance(width, int) and isinstance(height, int):
+                    candidates.append((width, height, url))
+                    break
+            else:
+                if key in ORIGIN_KEYS and all(url != candidate[2] for candidate in candidates):
+                    candidates.append((0, 0, url))
+    return candidates
+
+
+def size_options(options: list) -> list:
+    """
+    (width, height, url) candidates from the (text, href) pairs of a sizes menu, whose entries read like `1920×1080`.
+    """
+    candidates = list()
+    for text, url in options:
+        match = re.search(r'(\d+)\s*[×xX]\s*(\d+)', text or '')
+        if match and url:
+            candidates.append((int(match.group(1)), int(match.group(2)), url))
+    return candidates
+
+
+def largest(candidates: list) -> [str, None]:
+    """
+    URL of the candidate with the most pixels.
+    """
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: candidate[0] * candidate[1])[2]
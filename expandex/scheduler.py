@@ -0,0 +1,490 @@
+"""
+Per host pacing, retries and circuit breaking for the requests a crawl sends.
+"""
+import time
+import random
+import asyncio
+import threading
+from urllib.parse import urlparse
+from requests import exceptions
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+TRANSIENT_ERRORS = (
+    exceptions.Timeout,
+    exceptions.ConnectionError,
+    exceptions.ChunkedEncodingError,
+)  # Worth another attempt.
+if httpx is not None:
+    TRANSIENT_ERRORS += (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+
+class Retry(Exception):
+    """
+    A failure worth another attempt: a 429 or 5xx answer, or a request that gave up on every attempt.
+
+    `after` carries the delay the server asked for in its Retry-After header, if any.
+    """
+    def __init__(self, message: str = '', after: [float, None] = None):
+        super().__init__(message)
+        self.after = after
+
+
+class HostUnavailable(Exception):
+    """
+    Raised instead of sending a request to a host whose circuit is open.
+    """
+
+
+class DeadlineExceeded(HostUnavailable):
+    """
+    Raised when the deadline of the scout leaves no time to send a request.
+    """
+
+
+def retry_after(headers: any) -> [float, None]:
+    """
+    Seconds asked for by a Retry-After header, only the delay form is understood.
+    """
+    try:
+        return max(float(headers.get('Retry-After', '')), 0.0)
+    except (AttributeError, ValueError):
+        return None
+
+
+def check_status(response: any) -> any:
+    """
+    Raises `Retry` for answers that are worth another attempt, returns the response otherwise.
+    """
+    if response.status_code in RETRY_STATUS:
+        raise Retry(f'status {response.status_code}', retry_after(response.headers))
+    return response
+
+
+class Deadline:
+    """
+    The point in time `seconds` from now, never when `seconds` is None.
+    """
+    def __init__(self, seconds: [float, None] = None):
+        self.seconds = seconds
+        self.end = None if seconds is None else time.monotonic() + seconds
+
+    @property
+    def remaining(self) -> float:
+        """
+        Seconds left, infinite without a deadline.
+        """
+        if self.end is None:
+            return float('inf')
+        return max(self.end - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """
+        True once the deadline has passed.
+        """
+        return self.end is not None and time.monotonic() >= self.end
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket refilling `rate` tokens a second, holding at most `burst`. A rate of 0 never limits.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        """
+        Adds the tokens earned since the last call, the caller holds the lock.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    @property
+    def ready(self) -> bool:
+        """
+        True when a token can be spent right away.
+        """
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            self._refill()
+            return self.tokens >= 1
+
+    def reserve(self) -> float:
+        """
+        Takes a token, returns how many seconds to wait before spending it.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        """
+        Gives back a reserved token that was not spent.
+        """
+        if self.rate > 0:
+            with self.lock:
+                self.tokens = min(self.burst, self.tokens + 1)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` failures in a row and stays open for `cooldown` seconds. A single trial request is then let
+    through: success closes the circuit, failure opens it again for twice as long, up to `max_cooldown`.
+    """
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.wait = cooldown
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def _state(self) -> str:
+        """
+        `closed`, `open` or `half-open`, the caller holds the lock.
+        """
+        if self.opened is None:
+            return 'closed'
+        if time.monotonic() - self.opened < self.wait:
+            return 'open'
+        return 'half-open'
+
+    @property
+    def state(self) -> str:
+        """
+        `closed`, `open` or `half-open` (the cooldown is over and a trial request may go).
+        """
+        with self.lock:
+            return self._state()
+
+    @property
+    def ready(self) -> bool:
+        """
+        True when `allow` would let a request through.
+        """
+        with self.lock:
+            state = self._state()
+            return state == 'closed' or (state == 'half-open' and not self.trial)
+
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent now, the caller must report its outcome.
+        """
+        with self.lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        """
+        The request went through: closes the circuit and resets the cooldown.
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.wait = self.cooldown
+            self.trial = False
+
+    def failure(self):
+        """
+        The request failed: opens the circuit after `threshold` failures in a row, or again after a failed trial.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.trial:
+                self.trial = False
+                self.opened = time.monotonic()
+                self.wait = min(self.wait * 2, self.max_cooldown)
+            elif self.opened is None and self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+    def abandon(self):
+        """
+        The request ended without telling us anything about the host.
+        """
+        with self.lock:
+            self.trial = False
+
+
+def _wake(future: asyncio.Future):
+    """
+    Resolves the future a coroutine waits on for a slot, unless it gave up already.
+    """
+    if not future.done():
+        future.set_result(None)
+
+
+class Host:
+    """
+    What the scheduler knows about one host: its bucket, its breaker and how many requests it has in flight.
+
+    Threads and coroutines count against the same `limit`: threads wait on a condition, coroutines on a future of their
+    own event loop that every `release` resolves, so no asyncio object outlives the loop that made it.
+    """
+    def __init__(self, name: str, rate: float, burst: int, limit: int, threshold: int, cooldown: float):
+        self.name = name
+        self.limit = max(limit, 1)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(threshold, cooldown)
+        self.active = 0
+        self.condition = threading.Condition()
+        self.waiters = list()  # (event loop, future) of the coroutines waiting for a slot.
+
+    @property
+    def ready(self) -> bool:
+        """
+        True when the circuit lets requests through, a slot is free and a token is ready.
+        """
+        return self.breaker.ready and self.active < self.limit and self.bucket.ready
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Takes a slot, waiting up to `timeout` seconds for one to free up. False when none did.
+        """
+        timeout = None if timeout == float('inf') else timeout
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.active < self.limit, timeout):
+                return False
+            self.active += 1
+            return True
+
+    async def acquire_async(self, timeout: float) -> bool:
+        """
+        `acquire` for coroutines, waits without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        end = None if timeout == float('inf') else loop.time() + timeout
+        while True:
+            with self.condition:
+                if self.active < self.limit:
+                    self.active += 1
+                    return True
+                if end is not None and loop.time() >= end:
+                    return False
+                waiter = (loop, loop.create_future())
+                self.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], None if end is None else end - loop.time())
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    if waiter in self.waiters:
+                        self.waiters.remove(waiter)
+
+    def release(self):
+        """
+        Gives a slot back, from a thread or a coroutine, and wakes whoever waits for one.
+        """
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+            for loop, future in self.waiters:  # They race the threads for the slot, losers wait again.
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                except RuntimeError:  # That loop is closed, nobody is waiting there anymore.
+                    pass
+            self.waiters.clear()
+
+
+class HostScheduler:
+    """
+    Paces, retries and circuit breaks requests per host.
+
+    Every host gets a token bucket refilling `rate` requests a second (in bursts of up to `burst`), at most `per_host`
+    requests in flight and a circuit breaker that opens after `threshold` failures in a row for `cooldown` seconds.
+    Timeouts, dropped connections and `Retry` (429 and 5xx, see `check_status`) are retried up to `attempts` times,
+    after the delay the server asked for or an exponential backoff with full jitter starting at `backoff_base` seconds
+    and capped at `backoff_cap`. Every wait is bounded by the caller's `Deadline`.
+
+    Share one scheduler between locators so what one scout learns about a host the others respect.
+    """
+    def __init__(
+            self,
+            rate: float = 10.0,
+            burst: int = 10,
+            per_host: int = 6,
+            attempts: int = 3,
+            backoff_base: float = 0.5,
+            backoff_cap: float = 20.0,
+            threshold: int = 5,
+            cooldown: float = 30.0,
+            transient: tuple = TRANSIENT_ERRORS,
+            debug: bool = False,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.per_host = per_host
+        self.attempts = max(attempts, 1)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.transient = tuple(transient) + (Retry,)
+        self.debug = debug
+        self.hosts = dict()
+        self.lock = threading.Lock()
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def host(self, url: str) -> Host:
+        """
+        The `Host` of `url`, created the first time it is seen.
+        """
+        name = (urlparse(url).hostname or '').lower()
+        with self.lock:
+            host = self.hosts.get(name)
+            if host is None:
+                host = self.hosts[name] = Host(
+                    name, self.rate, self.burst, self.per_host, self.threshold, self.cooldown
+                )
+            return host
+
+    def ready(self, url: str) -> bool:
+        """
+        Whether a request to the host of `url` could start right away.
+        """
+        return self.host(url).ready
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Full jitter: anywhere between 0 and the exponential delay of `attempt`.
+        """
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def states(self) -> dict:
+        """
+        Circuit state of every host seen so far.
+        """
+        with self.lock:
+            hosts = list(self.hosts.values())
+        return {host.name: host.breaker.state for host in hosts}
+
+    def _admit(self, host: Host, deadline: Deadline):
+        """
+        Raises `HostUnavailable` while the circuit of `host` is open and `DeadlineExceeded` once time is up.
+        """
+        if not host.breaker.allow():
+            raise HostUnavailable(f'{host.name} keeps failing, circuit open')
+        if deadline.expired:
+            host.breaker.abandon()
+            raise DeadlineExceeded(f'no time left for {host.name}')
+
+    def _delay(self, host: Host, err: Exception, attempt: int, deadline: Deadline, metrics: any) -> float:
+        """
+        How long to wait before the next attempt, raises once there should be none.
+        """
+        host.breaker.failure()
+        after = err.after if isinstance(err, Retry) else None
+        if attempt + 1 >= self.attempts or (after is not None and after > self.backoff_cap):
+            raise Retry(f'{host.name}: giving up after {attempt + 1} attempts, {err}') from err
+        delay = self.backoff(attempt) if after is None else after
+        if delay >= deadline.remaining:
+            raise DeadlineExceeded(f'no time left to retry {host.name}') from err
+        if metrics is not None:
+            metrics.count('retries')
+        self.d_print(f'{host.name}: {err}, retrying in {delay:.2f}s')
+        return delay
+
+    def run(self, url: str, function: any, *args, deadline: [Deadline, None] = None, metrics: any = None, **kwargs):
+        """
+        Calls `function(*args, **kwargs)` as a request to the host of `url` and returns its result.
+
+        Raises `HostUnavailable` when the circuit is open, `DeadlineExceeded` when time ran out and `Retry` when every
+        attempt failed. `retries` are counted on `metrics` when given.
+        """
+        deadline = deadline or Deadline()
+        host = self.host(url)
+        for attempt in range(self.attempts):
+            self._admit(host, deadline)
+            if not host.acquire(deadline.remaining):
+                host.breaker.abandon()
+                raise DeadlineExceeded(f'no time left for {host.name}')
+            try:
+                wait = host.bucket.reserve()
+                if wait >= deadline.remaining:
+                    host.bucket.refund()
+                    host.breaker.abandon()
+                    raise DeadlineExceeded(f'no time left for {host.name}')
+                time.sleep(wait)
+                result = function(*args, **kwargs)
+            except self.transient as err:
+                failure = err
+            except BaseException:
+                host.breaker.abandon()
+                raise
+            else:
+                host.breaker.success()
+                return result
+            finally:
+                host.release()
+            time.sleep(self._delay(host, failure, attempt, deadline, metrics))
+
+    async def run_async(
+            self,
+            url: str,
+            function: any,
+            *args,
+            deadline: [Deadline, None] = None,
+            metrics: any = None,
+            slots: [asyncio.Semaphore, None] = None,
+            **kwargs
+    ):
+        """
+        `run` for a coroutine function, `slots` is acquired once the host lets the request through so a global cap is
+        not held while waiting on a busy host.
+        """
+        deadline = deadline or Deadline()
+        host = self.host(url)
+        for attempt in range(self.attempts):
+            self._admit(host, deadline)
+            if not await host.acquire_async(deadline.remaining):
+                host.breaker.abandon()
+                raise DeadlineExceeded(f'no time left for {host.name}')
+            try:
+                wait = host.bucket.reserve()
+                if wait >= deadline.remaining:
+                    host.bucket.refund()
+                    host.breaker.abandon()
+                    raise DeadlineExceeded(f'no time left for {host.name}')
+                await asyncio.sleep(wait)
+                if slots is None:
+                    result = await function(*args, **kwargs)
+                else:
+                    async with slots:
+                        result = await function(*args, **kwargs)
+            except self.transient as err:
+                failure = err
+            except BaseException:
+                host.breaker.abandon()
+                raise
+            else:
+                host.breaker.success()
+                return result
+            finally:
+                host.release()
+            await asyncio.sleep(self._delay(host, failure, attempt, deadline, metrics))
@@ -0,0 +1,195 @@
+"""
+Long-lived browser and context pool shared between scouts.
+"""
+import time
+from urllib.parse import urlparse
+from contextlib import contextmanager
+from playwright.sync_api import sync_playwright
+from playwright._impl._errors import Error  # noqa
+try:
+    from network import HttpClient
+except ImportError:
+    from .network import HttpClient
+
+
+class SessionPool:
+    """
+    Keeps a warm Firefox instance and a pool of browser contexts alive so repeated scouts skip the cold start.
+
+    Contexts are health checked when they are handed out and recycled after `max_uses` scouts, cookies fetched through
+    cloudscraper (through the shared `http` client when one is given) are cached per host for `cookie_ttl` seconds.
+    Playwright's sync API is bound to the thread that started it, so a pool should only be used from that thread.
+    """
+    def __init__(
+            self,
+            contexts: int = 2,
+            max_uses: int = 50,
+            cookie_ttl: float = 900.0,
+            launch_options: [dict, None] = None,
+            http: [HttpClient, None] = None,
+            debug: bool = False,
+    ):
+        self.contexts = contexts
+        self.max_uses = max_uses
+        self.cookie_ttl = cookie_ttl
+        self.launch_options = launch_options or dict()
+        self.debug = debug
+        self.playwright = None
+        self.browser = None
+        self.http = http
+        self.owns_http = http is None
+        self.idle = list()
+        self.uses = dict()
+        self.cookie_cache = dict()
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        return self.browser is not None
+
+    def start(self):
+        """
+        Launches the browser if it is not already up.
+        """
+        if self.http is None:
+            self.http = HttpClient(debug=self.debug)
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+        if self.browser is None:
+            self.d_print('launching browser')
+            self.browser = self.playwright.firefox.launch(**self.launch_options)
+        return self
+
+    def close(self):
+        """
+        Tears everything down.
+        """
+        for context in self.idle:
+            self._discard(context)
+        self.idle = list()
+        self.uses = dict()
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Error:
+                pass
+            self.browser = None
+        if self.playwright is not None:
+            self.playwright.stop()
+            self.playwright = None
+        if self.http is not None and self.owns_http:
+            self.http.close()
+            self.http = None
+        return self
+
+    def restart(self):
+        """
+        Drops the browser and every context, then launches a fresh one.
+        """
+        self.d_print('restarting browser')
+        for context in self.idle:
+            self._discard(context)
+        self.idle = list()
+        self.uses = dict()
+        try:
+            if self.browser is not None:
+                self.browser.close()
+        except Error:
+            pass
+        self.browser = None
+        return self.start()
+
+    def cookies(self, url: str) -> list:
+        """
+        Cloudscraper cookies for the host of `url`, fetched once per `cookie_ttl`.
+        """
+        host = urlparse(url).netloc
+        cached = self.cookie_cache.get(host)
+        if cached is not None and time.monotonic() - cached[0] < self.cookie_ttl:
+            return cached[1]
+        cookies = self.http.browser_cookies(url)
+        self.cookie_cache[host] = (time.monotonic(), cookies)
+        return cookies
+
+    def _healthy(self, context: any) -> bool:
+        """
+        A context is usable if its browser is still connected and it still answers.
+        """
+        try:
+            context.cookies()
+        except Error:
+            return False
+        return True
+
+    def _discard(self, context: any):
+        """
+        Closes a context and forgets about it.
+        """
+        self.uses.pop(id(context), None)
+        try:
+            context.close()
+        except Error:
+            pass
+
+    def acquire(self, url: str) -> any:
+        """
+        Hands out a healthy context carrying the cookies for `url`.
+        """
+        self.start()
+        if not self.browser.is_connected():
+            self.restart()
+        while self.idle:
+            context = self.idle.pop()
+            if self._healthy(context):
+                break
+            self.d_print('dropping unhealthy context')
+            self._discard(context)
+        else:
+            context = self.browser.new_context()
+            self.uses[id(context)] = 0
+        context.add_cookies(self.cookies(url))
+        self.uses[id(context)] += 1
+        return context
+
+    def release(self, context: any, healthy: bool = True):
+        """
+        Returns a context to the pool, recycling it once it has been used `max_uses` times.
+        """
+        uses = self.uses.get(id(context), self.max_uses)
+        if not healthy or uses >= self.max_uses or len(self.idle) >= self.contexts:
+            self._discard(context)
+        else:
+            for page in context.pages:
+                try:
+                    page.close()
+                except Error:
+                    pass
+            self.idle.append(context)
+        return self
+
+    @contextmanager
+    def context(self, url: str):
+        """
+        Borrow a context for the duration of a with block.
+        """
+        context = self.acquire(url)
+        healthy = True
+        try:
+            yield context
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            self.release(context, healthy)
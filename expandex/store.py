@@ -0,0 +1,188 @@
+"""
+SQLite manifest of the images saved to a folder.
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from PIL import Image
+try:
+    from index import perceptual_hash
+except ImportError:
+    from .index import perceptual_hash
+
+MANIFEST_NAME = '.expandex_manifest.sqlite'
+
+EXTENSIONS = {
+    'jpeg': 'jpg',
+    'mpo': 'jpg',
+    'png': 'png',
+    'webp': 'webp',
+    'bmp': 'bmp',
+    'tiff': 'tiff',
+}  # OpenCV cannot write everything it can read, anything else is stored as PNG.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    name TEXT PRIMARY KEY,
+    url TEXT,
+    digest TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    phash TEXT,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS images_url ON images (url);
+CREATE INDEX IF NOT EXISTS images_digest ON images (digest);
+"""
+
+
+def content_name(digest: str, image_format: str) -> str:
+    """
+    Content addressed file name for a download.
+    """
+    return f"{digest}.{EXTENSIONS.get(image_format, 'png')}"
+
+
+class Manifest:
+    """
+    Records every image saved to a folder: where it came from, the MD5 of the downloaded bytes, its dimensions,
+    perceptual hash and when it was written.
+
+    Lookups by URL and by digest let the downloader skip known images before anything is decoded, and `names` gives the
+    feature index the folder contents without listing and sniffing it. Keys that are being downloaded right now can be
+    `claim`ed so two threads never fetch the same thing twice.
+    """
+    def __init__(self, folder: str, debug: bool = False):
+        self.folder = folder
+        self.debug = debug
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.claimed = set()
+        os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.load()
+
+    def d_print(self, *args, **kwargs):
+        """
+        Debug messanger.
+        """
+        if self.debug:
+            print(*args, **kwargs)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+
+    def __contains__(self, name: str) -> bool:
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM images WHERE name = ?', (name,)).fetchone() is not None
+
+    def load(self):
+        """
+        Drops the rows whose files are gone, and records the images added to the folder behind the manifest's back
+        (or before it had one). Files that are already recorded are not read again.
+        """
+        with self.lock:
+            names = {row[0] for row in self.connection.execute('SELECT name FROM images')}
+            missing = [(name,) for name in names if not os.path.isfile(os.path.join(self.folder, name))]
+            if missing:
+                self.d_print(f'dropping {len(missing)} missing images from the manifest')
+                self.connection.executemany('DELETE FROM images WHERE name = ?', missing)
+                self.connection.commit()
+        for image_file in sorted(os.listdir(self.folder)):
+            image_file_path = os.path.join(self.folder, image_file)
+            if image_file in names or image_file.startswith('.expandex_') or os.path.isdir(image_file_path):
+                continue
+            try:
+                with Image.open(image_file_path) as im:  # Raises for anything that is not an image.
+                    width, height = im.size
+                    phash = perceptual_hash(im)
+                with open(image_file_path, 'rb') as file:
+                    digest = hashlib.md5(file.read()).hexdigest()
+            except (IOError, OSError):
+                continue
+            self.add(image_file, None, digest, width, height, phash)
+        return self
+
+    def close(self):
+        """
+        Closes the database, the manifest cannot be used afterwards.
+        """
+        with self.lock:
+            self.connection.close()
+
+    def find_url(self, url: str) -> [str, None]:
+        """
+        Name of the image downloaded from `url`, if any.
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT name FROM images WHERE url = ? LIMIT 1', (url,)).fetchone()
+        return row[0] if row else None
+
+    def find_digest(self, digest: str) -> [str, None]:
+        """
+        Name of the image whose downloaded bytes had this MD5, if any.
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT name FROM images WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+        return row[0] if row else None
+
+    def names(self) -> list:
+        """
+        Every recorded image, by name.
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT name FROM images ORDER BY name')]
+
+    def claim(self, key: str) -> bool:
+        """
+        Marks a URL or digest as in flight, False when another thread already holds it.
+        """
+        with self.lock:
+            if key in self.claimed:
+                return False
+            self.claimed.add(key)
+            return True
+
+    def release(self, *keys: str):
+        """
+        Gives up the claims on these URLs or digests.
+        """
+        with self.lock:
+            for key in keys:
+                self.claimed.discard(key)
+
+    def add(
+            self,
+            name: str,
+            url: [str, None],
+            digest: str,
+            width: int,
+            height: int,
+            phash: [int, None] = None,
+    ):
+        """
+        Records a saved image.
+        """
+        phash = None if phash is None else f'{phash:016x}'
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO images (name, url, digest, width, height, phash, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (name, url, digest, width, height, phash, time.time()),
+            )
+            self.connection.commit()
+        return self
+
+    def remove(self, name: str):
+        """
+        Forgets a saved image.
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM images WHERE name = ?', (name,))
+            self.connection.commit()
+        return self
@@ -0,0 +1,214 @@
+"""
+Optional process pool for the CPU heavy image stage.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from multiprocessing import shared_memory, get_context
+from concurrent.futures import ProcessPoolExecutor
+from featurecrop import featurecrop
+try:
+    from index import extract_features, hash_key
+except ImportError:
+    from .index import extract_features, hash_key
+
+_state = dict()
+SOURCES = 4  # Source images a worker keeps, one per scout running at the same time.
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Opens a block created by the parent, without asking the resource tracker to clean it up on our behalf.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _initialize(limits: dict, device: [str, None], radius: int, reject: int, debug: bool):
+    """
+    Runs once in every worker, this is where the models are loaded.
+    """
+    _state['deduplicator'] = None
+    if device:
+        from antidupe import Antidupe
+        _state['deduplicator'] = Antidupe(device=device, limits=limits, debug=debug)
+    _state['radius'] = radius
+    _state['reject'] = reject
+    _state['sources'] = OrderedDict()
+
+
+def _source_image(source: tuple) -> Image.Image:
+    """
+    The source image of a scout, copied out of shared memory once per worker and kept for the last few scouts.
+    """
+    name, shape, dtype, _ = source
+    sources = _state['sources']
+    if name in sources:
+        sources.move_to_end(name)
+        return sources[name]
+    shm = _attach(name)
+    try:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        sources[name] = Image.fromarray(array.copy())
+        del array
+    finally:
+        shm.close()
+    while len(sources) > SOURCES:
+        sources.popitem(last=False)
+    return sources[name]
+
+
+def _examine(image: np.ndarray, source: [tuple, None]) -> tuple:
+    """
+    Features of a crop and whether it duplicates the source (None if not checked).
+    """
+    features = extract_features(image)
+    source_duplicate = None
+    if source is not None and _state['deduplicator'] is not None:
+        distance = (hash_key(features) ^ hash_key(source[3])).bit_count()
+        if distance <= _state['reject']:
+            source_duplicate = True
+        elif distance <= _state['radius']:
+            source_duplicate = bool(_state['deduplicator'].predict([image, _source_image(source)]))
+        else:
+            source_duplicate = False
+    return features, source_duplicate
+
+
+def process(name: str, shape: tuple, dtype: str, source: [tuple, None] = None) -> dict:
+    """
+    Featurecrops the image held in shared memory, computes the features of the crop and writes it back over the image
+    when something was cut off.
+
+    When a source is given the candidate is also compared against it, the full Antidupe check only runs for candidates
+    within the prefilter radius.
+    """
+    shm = _attach(name)
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        cropped = featurecrop(image)
+        features, source_duplicate = _examine(cropped, source)  # Before the block is closed, so no copy is needed.
+        cropped_shape = cropped.shape
+        if cropped_shape != image.shape:
+            output = np.ndarray(cropped_shape, dtype=cropped.dtype, buffer=shm.buf)
+            output[...] = cropped
+            del output
+        del image, cropped
+    finally:
+        shm.close()
+    return {'shape': cropped_shape, 'features': features, 'source_duplicate': source_duplicate}
+
+
+class ProcessStage:
+    """
+    Runs featurecrop, feature extraction and the comparison against the source image in a pool of processes.
+
+    Decoded pixels travel through shared memory rather than being pickled: the parent copies the decoded image into a
+    block, the worker writes the crop back into the same block (only when it cut something off), and only the small
+    feature dictionary comes back over the pipe. Each worker loads the models once.
+
+    One stage serves several scouts at once (the children of `scout_many`), each shares its source image under its own
+    key and releases it when it is done.
+    """
+    def __init__(
+            self,
+            workers: int,
+            limits: dict,
+            device: [str, None] = None,
+            radius: int = 40,
+            reject: int = 6,
+            debug: bool = False,
+    ):
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=_initialize,
+            initargs=(limits, device, radius, reject, debug),
+        )
+        self.sources = dict()  # key: (block, source, id of the image shared)
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _share(array: np.ndarray) -> shared_memory.SharedMemory:
+        """
+        Copies an array into a new shared memory block.
+        """
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        del view
+        return block
+
+    def _release_source(self, key: str):
+        """
+        Frees the block holding the source image of `key`, the caller holds the lock.
+        """
+        entry = self.sources.pop(key, None)
+        if entry is not None:
+            entry[0].close()
+            entry[0].unlink()
+
+    def set_source(self, key: str, image: [np.ndarray, Image.Image], features: dict):
+        """
+        Shares the source image of the scout `key` with the workers.
+        """
+        with self.lock:
+            entry = self.sources.get(key)
+            if entry is not None and entry[2] == id(image):
+                return self
+            self._release_source(key)
+            array = np.asarray(image)
+            block = self._share(array)
+            self.sources[key] = (block, (block.name, array.shape, array.dtype.str, features), id(image))
+        return self
+
+    def release_source(self, key: str):
+        """
+        Frees the source image of the scout `key`, call it once nothing of that scout is left to process.
+        """
+        with self.lock:
+            self._release_source(key)
+        return self
+
+    def process(self, image: np.ndarray, key: [str, None] = None) -> tuple:
+        """
+        Returns the cropped image, its features and whether it duplicates the source of the scout `key` (None if not
+        checked).
+
+        When nothing was cropped the image passed in is returned as it is, otherwise the crop is copied out of the
+        block.
+        """
+        with self.lock:
+            entry = self.sources.get(key)
+        source = None if entry is None else entry[1]
+        block = self._share(image)
+        try:
+            result = self.executor.submit(process, block.name, image.shape, image.dtype.str, source).result()
+            if tuple(result['shape']) == image.shape:
+                return image, result['features'], result['source_duplicate']
+            view = np.ndarray(result['shape'], dtype=image.dtype, buffer=block.buf)
+            cropped = view.copy()
+            del view
+        finally:
+            block.close()
+            block.unlink()
+        return cropped, result['features'], result['source_duplicate']
+
+    def close(self):
+        """
+        Stops the workers and frees the shared source images.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            for key in list(self.sources):
+                self._release_source(key)
+        return self
@@ -33,6 +33,9 @@ setup(
     version='0.0.1',
     packages=find_packages(),
     install_requires=install_requires,
+    extras_require={
+        'async': ['httpx[http2]'],
+    },
     entry_points={
         'console_scripts': [
         ],
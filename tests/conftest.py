@@ -0,0 +1,8 @@
+"""
+Puts the package modules on the path by their plain names, the way they import one another, so the modules that do
+not need a browser are tested without Playwright installed.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'expandex'))
@@ -0,0 +1,76 @@
+import threading
+import numpy as np
+from batch import BatchDeduplicator
+from index import FeatureIndex, extract_features
+
+
+def features(phash: int, dhash: int = 0) -> dict:
+    result = extract_features(np.zeros((16, 16, 3), dtype=np.uint8))
+    result.update(phash=phash, dhash=dhash, hash=phash)
+    return result
+
+
+def batcher(tmp_path, source: dict, **kwargs) -> tuple:
+    index = FeatureIndex(str(tmp_path), extractor=extract_features, listing=lambda: list())
+    defaults = dict(
+        index_getter=lambda: index,
+        embedder=None,
+        source_getter=lambda: source,
+        source_check=None,
+        limits={'dedup': 0},
+        radius=40,
+        reject=6,
+        window=0.01,
+    )
+    defaults.update(kwargs)
+    return BatchDeduplicator(**defaults), index
+
+
+def test_close_stops_and_check_restarts(tmp_path):
+    deduplicator, index = batcher(tmp_path, features(0))
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    assert not deduplicator.check('a.png', image, features(2 ** 64 - 1))
+    worker = deduplicator.worker
+    assert worker.is_alive()
+    deduplicator.close()
+    assert deduplicator.worker is None and not worker.is_alive()
+    assert deduplicator.check('b.png', image, features(2 ** 64 - 1)) is True  # Same hashes as a.png.
+    assert deduplicator.worker is not worker
+    deduplicator.close().close()
+    assert 'a.png' in index and 'b.png' not in index
+
+
+def test_source_check_runs_on_caller_thread(tmp_path):
+    calls = list()
+
+    def source_check(image: np.ndarray) -> bool:
+        calls.append(threading.current_thread())
+        return True
+
+    deduplicator, _ = batcher(tmp_path, features(0), source_check=source_check)
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    try:
+        assert deduplicator.check('near.png', image, features(2 ** 20 - 1))  # 20 bits off the source.
+        assert not deduplicator.check('far.png', image, features(2 ** 60 - 1))  # Outside the radius.
+        assert deduplicator.check('same.png', image, features(1))  # Within `reject`, no model needed.
+    finally:
+        deduplicator.close()
+    assert calls == [threading.current_thread()]
+
+
+def test_verifier_sees_nearest_stored_images(tmp_path):
+    seen = list()
+
+    def verifier(pairs: list) -> list:
+        seen.append([name for _, name in pairs])
+        return [name == 'stored_1.png' for _, name in pairs]
+
+    deduplicator, index = batcher(tmp_path, features(2 ** 64 - 1), verifier=verifier, verify=2)
+    for number, phash in enumerate((2 ** 10 - 1, 2 ** 12 - 1, 2 ** 14 - 1)):
+        index.add(f'stored_{number}.png', features(phash))
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    try:
+        assert deduplicator.check('candidate.png', image, features(0))
+    finally:
+        deduplicator.close()
+    assert seen == [['stored_0.png', 'stored_1.png']]
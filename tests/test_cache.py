@@ -0,0 +1,39 @@
+import os
+import time
+from cache import SearchCache
+
+
+def test_cache_expires_parts_separately(tmp_path, monkeypatch):
+    cache = SearchCache(str(tmp_path), ttl=100, search_ttl=10)
+    cache.put('key', search_url='https://search', links=['a', 'b'], resolved={'a': 'https://a.jpg', 'b': None})
+    assert cache.get('key') == {'search_url': 'https://search', 'links': ['a', 'b'], 'resolved': {'a': 'https://a.jpg'}}
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 50)
+    cache.put('key', resolved={'a': 'https://a.jpg', 'b': 'https://b.jpg'})
+    resolved = {'a': 'https://a.jpg', 'b': 'https://b.jpg'}
+    assert cache.get('key') == {'search_url': None, 'links': ['a', 'b'], 'resolved': resolved}
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    assert cache.get('key') == {'search_url': None, 'links': None, 'resolved': {'b': 'https://b.jpg'}}
+    assert cache.get('missing') == {'search_url': None, 'links': None, 'resolved': dict()}
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = SearchCache(str(tmp_path), max_entries=2)
+    cache.put('a', search_url='https://a')
+    cache.put('b', search_url='https://b')
+    os.utime(tmp_path / 'a.json', (1, 1))
+    os.utime(tmp_path / 'b.json', (2, 2))
+    cache.get('a')
+    cache.put('c', search_url='https://c')
+    assert sorted(os.listdir(tmp_path)) == ['a.json', 'c.json']
+    cache.remove('a').remove('missing')
+    assert os.listdir(tmp_path) == ['c.json']
+    cache.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_cache_evicts_past_max_bytes(tmp_path):
+    cache = SearchCache(str(tmp_path), max_bytes=300)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, links=[key * 100])
+    assert os.listdir(tmp_path) == ['c.json']
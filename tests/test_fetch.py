@@ -0,0 +1,73 @@
+from io import BytesIO
+import pytest
+from PIL import Image
+from fetch import Rejected, sniff, read_image, probe_image
+
+
+def encode(fmt: str, size: tuple = (40, 30)) -> bytes:
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 10, 10)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class Response:
+    def __init__(self, body: bytes, status_code: int = 200, headers: [dict, None] = None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {'Content-Type': 'image/jpeg'}
+
+    def iter_content(self, size: int):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+
+@pytest.mark.parametrize(
+    'fmt, name', [('PNG', 'png'), ('GIF', 'gif'), ('BMP', 'bmp'), ('WEBP', 'webp'), ('JPEG', 'jpeg')]
+)
+def test_sniff_reads_format_and_size(fmt, name):
+    data = encode(fmt)
+    assert sniff(data) == {'format': name, 'width': 40, 'height': 30}
+
+
+def test_sniff_waits_for_the_header():
+    assert sniff(encode('PNG')[:16]) is None
+    assert sniff(b'<html>not an image</html>') is None
+
+
+def test_read_image_checks_headers_and_size():
+    data = encode('JPEG')
+    assert read_image(Response(data), 1 << 20, 10000) == (data, {'format': 'jpeg', 'width': 40, 'height': 30})
+    with pytest.raises(Rejected, match='content type'):
+        read_image(Response(data, headers={'Content-Type': 'text/html'}), 1 << 20, 10000)
+    with pytest.raises(Rejected, match='content length'):
+        read_image(Response(data, headers={'Content-Length': str(1 << 21)}), 1 << 20, 10000)
+    with pytest.raises(Rejected, match='pixels'):
+        read_image(Response(data), 1 << 20, 100)
+    with pytest.raises(Rejected, match='not an image'):
+        read_image(Response(b'<html></html>'), 1 << 20, 10000)
+
+
+def test_probe_image_stops_at_the_range():
+    data = encode('PNG', (400, 300))
+    headers = {'Content-Type': 'image/png', 'Content-Range': f'bytes 0-99/{len(data)}'}
+    body, info, complete = probe_image(Response(data[:100], 206, headers), 1 << 20, 1 << 20, limit=100)
+    assert body == data[:100] and info == {'format': 'png', 'width': 400, 'height': 300} and not complete
+    headers = {'Content-Type': 'image/png', 'Content-Range': f'bytes 0-{len(data) - 1}/{len(data)}'}
+    assert probe_image(Response(data, 206, headers), 1 << 20, 1 << 20) == (data, info, True)
+
+
+def test_probe_image_reads_servers_that_ignore_the_range():
+    data = encode('JPEG')
+    body, info, complete = probe_image(Response(data), 1 << 20, 1 << 20, limit=100)
+    assert body == data and info['format'] == 'jpeg' and complete
+
+
+def test_probe_image_rejects_candidates_from_the_header():
+    data = encode('JPEG', (400, 300))
+    with pytest.raises(Rejected, match='smaller than 512'):
+        probe_image(Response(data), 1 << 20, 1 << 20, min_side=512)
+    with pytest.raises(Rejected, match='not one of png'):
+        probe_image(Response(data), 1 << 20, 1 << 20, formats=('png',))
+    headers = {'Content-Type': 'image/jpeg', 'Content-Range': 'bytes 0-99/4194304'}
+    with pytest.raises(Rejected, match='exceeds'):
+        probe_image(Response(data[:100], 206, headers), 1 << 20, 1 << 20)
@@ -0,0 +1,51 @@
+import numpy as np
+from PIL import Image
+from index import BKTree, FeatureIndex, extract_features, hash_key
+
+
+def test_index_keeps_embeddings_float32(tmp_path):
+    index = FeatureIndex(str(tmp_path), extractor=extract_features, listing=lambda: list())
+    image = np.zeros((16, 16, 3), dtype=np.uint8)
+    features = extract_features(image)
+    features['embedding'] = np.ones(4)
+    index.add('a.png', features)
+    index.add('b.png', extract_features(image))
+    assert index.embeddings.dtype == np.float32
+    assert np.isnan(index.embeddings[1]).all()
+    assert index.neighbors(features, 0) == [(0, 'a.png'), (0, 'b.png')]
+
+
+def test_index_reloads_and_drops_stale_entries(tmp_path):
+    Image.fromarray(np.full((16, 16, 3), 200, dtype=np.uint8)).save(tmp_path / 'a.png')
+    Image.fromarray(np.eye(16, dtype=np.uint8) * 255).save(tmp_path / 'b.png')
+    (tmp_path / 'notes.txt').write_text('not an image')
+    index = FeatureIndex(str(tmp_path), extractor=extract_features)
+    assert sorted(index.names) == ['a.png', 'b.png']
+    (tmp_path / 'b.png').unlink()
+    reloaded = FeatureIndex(str(tmp_path), extractor=extract_features)
+    assert reloaded.names == ['a.png']
+    assert reloaded.keys == [hash_key(extract_features(Image.open(tmp_path / 'a.png')))]
+
+
+def test_bktree_query_within_radius_nearest_first():
+    tree = BKTree()
+    for key, name in ((0b0000, 'a'), (0b0001, 'b'), (0b0011, 'c'), (0b1111, 'd'), (0b0001, 'e')):
+        tree.add(key, name)
+    assert len(tree) == 5
+    assert tree.query(0b0000, 0) == [(0, 'a')]
+    assert tree.query(0b0000, 2) == [(0, 'a'), (1, 'b'), (1, 'e'), (2, 'c')]
+    assert sorted(tree.query(0b1111, 2)) == [(0, 'd'), (2, 'c')]
+    assert tree.query(0, -1) == []
+    assert BKTree().query(0, 10) == []
+
+
+def test_bktree_matches_brute_force():
+    rng = np.random.default_rng(0)
+    keys = [int(k) for k in rng.integers(0, 2 ** 16, 300)]
+    tree = BKTree()
+    for i, key in enumerate(keys):
+        tree.add(key, i)
+    for probe in keys[:20]:
+        distances = [((probe ^ key).bit_count(), i) for i, key in enumerate(keys)]
+        expected = sorted(pair for pair in distances if pair[0] <= 5)
+        assert sorted(tree.query(probe, 5)) == expected
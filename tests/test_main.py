@@ -0,0 +1,47 @@
+from io import BytesIO
+import numpy as np
+import pytest
+from PIL import Image
+
+for module in ('antidupe', 'featurecrop', 'playwright', 'cloudscraper'):
+    pytest.importorskip(module)
+from fetch import sniff  # noqa
+from main import Locator  # noqa
+
+
+def test_byte_identical_images_at_new_urls_take_no_quota(tmp_path):
+    pixels = np.zeros((96, 128, 3), dtype=np.uint8)
+    pixels[..., 0] = np.arange(128, dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, 'PNG')
+    content = buffer.getvalue()
+    locator = Locator(save_folder=str(tmp_path), deduplicate='', http2=False)
+    try:
+        locator._prepare(5)
+        path = locator._store('https://a.example/image.png', content, sniff(content))
+        assert path is not None
+        assert locator._store('https://b.example/copy.png', content, sniff(content)) is None
+        assert locator.quota.count == 1
+        assert locator.metrics.summary().counters['rejected.exact_duplicate'] == 1
+        assert locator._precheck('https://a.example/image.png') == (True, path)  # A known URL still counts.
+        assert locator.quota.count == 2
+    finally:
+        locator.manifest.close()
+        locator.http.close()
+
+
+def test_iter_scout_cleans_up_when_the_upload_fails(tmp_path, monkeypatch):
+    locator = Locator(save_folder=str(tmp_path), deduplicate='', http2=False)
+    retired = list()
+
+    def upload(image):
+        raise ConnectionError('upload failed')
+
+    monkeypatch.setattr(locator, 'get_search_root', upload)
+    monkeypatch.setattr(locator, '_retire', lambda: retired.append(True))
+    try:
+        with pytest.raises(ConnectionError):
+            next(locator.iter_scout(np.zeros((32, 32, 3), dtype=np.uint8)))
+        assert retired == [True] and locator.on_accept is None and locator.summary is not None
+    finally:
+        locator.http.close()
@@ -0,0 +1,36 @@
+from metrics import Metrics, JsonLinesSink, PrometheusSink
+
+
+def test_metrics_summary_and_sinks(tmp_path):
+    events = list()
+    lines = tmp_path / 'scouts.jsonl'
+    metrics = Metrics(sinks=[events.append, JsonLinesSink(str(lines))], source='a.jpg')
+    with metrics.timer('download'):
+        pass
+    metrics.record('download', 0.5)
+    metrics.count('bytes', 100)
+    metrics.count('bytes', 20)
+    summary = metrics.finish()
+    assert summary.stages['download']['count'] == 2 and summary.stages['download']['max'] >= 0.5
+    assert summary.counters == {'bytes': 120}
+    assert [event['type'] for event in events] == ['timer', 'timer', 'counter', 'counter', 'summary']
+    assert all(event['source'] == 'a.jpg' for event in events)
+    assert len(lines.read_text().splitlines()) == 5
+
+
+def test_prometheus_sink_accumulates_and_escapes_labels(tmp_path):
+    path = tmp_path / 'expandex.prom'
+    sink = PrometheusSink(str(path))
+    for _ in range(2):
+        metrics = Metrics(sinks=[sink])
+        metrics.record('probe', 0.25)
+        metrics.count('rejected.probe')
+        metrics.count('odd "name"\\\n')
+        metrics.finish()
+    text = path.read_text()
+    assert 'expandex_scouts_total 2' in text
+    assert 'expandex_stage_seconds_total{stage="probe"} 0.500000' in text
+    assert 'expandex_stage_calls_total{stage="probe"} 2' in text
+    assert 'expandex_events_total{name="rejected.probe"} 2' in text
+    assert 'expandex_events_total{name="odd \\"name\\"\\\\\\n"} 2' in text
+    assert all(line.startswith(('#', 'expandex_')) for line in text.splitlines())
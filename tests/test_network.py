@@ -0,0 +1,48 @@
+import threading
+import pytest
+from requests.adapters import HTTPAdapter
+
+cloudscraper = pytest.importorskip('cloudscraper')
+from network import HttpClient, LockedCookieJar  # noqa
+
+
+def test_iterating_while_another_thread_writes():
+    jar = LockedCookieJar()
+    stop = threading.Event()
+
+    def write():
+        count = 0
+        while not stop.is_set():
+            jar.set(f'cookie{count % 200}', str(count), domain='example.com')
+            count += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(500):
+            list(jar)
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_version_changes_with_every_write():
+    jar = LockedCookieJar()
+    jar.set('a', '1', domain='example.com')
+    version = jar.version
+    assert [cookie.name for cookie in jar] == ['a']
+    assert jar.version == version
+    del jar['a']
+    assert jar.version > version and jar.get('a') is None
+
+
+def test_client_pools_connections_behind_the_scraper_adapter():
+    with HttpClient(pool_connections=3, pool_maxsize=7, http2=False) as client:
+        secure = client.scraper.get_adapter('https://example.com')
+        plain = client.scraper.get_adapter('http://example.com')
+        assert isinstance(secure, cloudscraper.CipherSuiteAdapter)
+        assert (secure.cipherSuite, secure.ecdhCurve) == (client.scraper.cipherSuite, client.scraper.ecdhCurve)
+        assert type(plain) is HTTPAdapter
+        for adapter in (secure, plain):
+            assert adapter._pool_connections == 3 and adapter._pool_maxsize == 7
+            assert adapter.poolmanager.connection_pool_kw['maxsize'] == 7
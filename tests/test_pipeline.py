@@ -0,0 +1,95 @@
+import threading
+from pipeline import Quota, Pipeline
+
+
+def test_quota_hands_out_limit_slots_across_threads():
+    quota = Quota(50)
+    taken = list()
+
+    def take():
+        for _ in range(20):
+            if quota.take():
+                taken.append(1)
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(taken) == 50 and quota.count == 50
+    assert quota.full and quota.reached.is_set()
+
+
+def test_quota_close_and_empty_quota():
+    quota = Quota(5)
+    assert quota.take() and not quota.full
+    quota.close()
+    assert quota.full and not quota.take() and quota.count == 1
+    assert Quota(0).full and not Quota(0).take()
+
+
+def test_pipeline_runs_everything_once():
+    seen = list()
+    lock = threading.Lock()
+
+    def handler(item: int):
+        with lock:
+            seen.append(item)
+
+    with Pipeline(handler, workers=4, queue_size=2) as pipeline:
+        for item in range(100):
+            assert pipeline.put(item)
+    assert sorted(seen) == list(range(100))
+    assert not pipeline.busy and pipeline.threads == []
+
+
+def test_pipeline_drops_queued_work_once_stopped():
+    stop = threading.Event()
+    started, release = threading.Event(), threading.Event()
+    seen = list()
+
+    def handler(item: int):
+        seen.append(item)
+        started.set()
+        release.wait(5)
+
+    pipeline = Pipeline(handler, workers=1, queue_size=10, stop=stop).start()
+    pipeline.put(0)
+    started.wait(5)
+    for item in range(1, 5):
+        pipeline.put(item)
+    stop.set()
+    release.set()
+    pipeline.close()
+    assert seen == [0]
+    assert not pipeline.put(5)
+
+
+def test_pipeline_defers_items_that_are_not_ready():
+    order = list()
+    blocked = {'busy.example.com'}
+
+    def handler(item: str):
+        order.append(item)
+        blocked.clear()  # The busy host frees up once other work ran.
+
+    pipeline = Pipeline(handler, workers=1, queue_size=8, ready=lambda item: item not in blocked)
+    for item in ('busy.example.com', 'a.example.com', 'b.example.com'):
+        pipeline.put(item)
+    pipeline.start().close()
+    assert order[0] == 'a.example.com'
+    assert sorted(order) == ['a.example.com', 'b.example.com', 'busy.example.com']
+
+
+def test_pipeline_survives_handler_errors():
+    seen = list()
+
+    def handler(item: int):
+        if item == 1:
+            raise ValueError('boom')
+        seen.append(item)
+
+    with Pipeline(handler, workers=2) as pipeline:
+        for item in range(3):
+            pipeline.put(item)
+    assert sorted(seen) == [0, 2]
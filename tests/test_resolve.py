@@ -0,0 +1,98 @@
+import html
+import json
+from resolve import parse_viewer, largest, size_options, viewed_item
+
+VIEWED = 'https://images.example.com/photos/viewed.jpg'
+RELATED = 'https://cdn.example.org/big/related.png'
+LINK = f'https://yandex.com/images/search?pos=3&img_url={VIEWED.replace(":", "%3A").replace("/", "%2F")}&rpt=imageview'
+
+
+def page(state: dict, body: str = '') -> str:
+    return f'<html><body><div data-state="{html.escape(json.dumps(state))}"></div>{body}</body></html>'
+
+
+def carousel(viewed: bool = True) -> dict:
+    items = [
+        {
+            'pos': 4,
+            'url': 'https://example.org/gallery/related.html',
+            'img_href': RELATED,
+            'sizes': [{'url': RELATED, 'w': 4000, 'h': 3000}],
+        },
+        {'pos': 5, 'url': 'https://example.org/pages/article', 'w': 5000, 'h': 5000},
+    ]
+    if viewed:
+        items.insert(1, {
+            'pos': 3,
+            'img_href': VIEWED,
+            'sizes': [
+                {'url': 'https://images.example.com/photos/viewed_small.jpg', 'w': 400, 'h': 300},
+                {'url': VIEWED, 'w': 800, 'h': 600},
+            ],
+        })
+    return {'viewer': {'items': items}}
+
+
+def test_viewed_item():
+    assert viewed_item(LINK) == (VIEWED, '3')
+    assert viewed_item('https://yandex.com/images/search?rpt=imageview') == (None, None)
+    assert viewed_item(None) == (None, None)
+
+
+def test_picks_viewed_item_over_larger_related_items():
+    candidates = parse_viewer(page(carousel()), LINK)
+    assert largest(candidates) == VIEWED
+    assert all(url != RELATED for _, _, url in candidates)
+
+
+def test_falls_back_to_pos_without_img_url():
+    assert largest(parse_viewer(page(carousel()), 'https://yandex.com/images/search?pos=3')) == VIEWED
+
+
+def test_no_viewed_item_leaves_nothing():
+    assert parse_viewer(page(carousel(viewed=False)), LINK) == []
+    assert parse_viewer(page(carousel())) == []
+    assert largest([]) is None
+
+
+def test_rejects_pages():
+    state = {'pos': 3, 'url': 'https://example.org/photos/viewed.html', 'w': 900, 'h': 900}
+    assert parse_viewer(page(state), LINK) == []
+    state['img_href'] = VIEWED
+    assert parse_viewer(page(state), LINK) == [(900, 900, VIEWED)]
+
+
+def test_script_state_and_previews():
+    state = {'items': [{'pos': 3, 'origUrl': 'https://im0-tub-ru.yandex.net/i?id=1', 'w': 10, 'h': 10}]}
+    text = f'<script type="application/json">{json.dumps(state)}</script>'
+    assert parse_viewer(text, LINK) == []
+    state['items'][0]['origUrl'] = VIEWED
+    assert parse_viewer(f'<script>{json.dumps(state)}</script>', LINK) == [(10, 10, VIEWED)]
+
+
+def menu(*entries: tuple) -> str:
+    options = ''.join(f'<li><a href="{url}">{size}</a></li>' for url, size in entries)
+    return f'<div class="OpenImageButton OpenImageButton_sizes"><div><ul>{options}</ul></div></div>'
+
+
+def test_sizes_menu():
+    body = menu(
+        ('https://a.example.com/i.jpg?s=1', '320×240'),
+        ('https://a.example.com/i.jpg', '1920 x 1080'),
+        ('https://a.example.com/i.html', '9000×9000'),
+    )
+    assert largest(parse_viewer(body)) == 'https://a.example.com/i.jpg'
+    assert size_options([('1920×1080', 'u1'), ('640×480', 'u2'), ('Open', 'u3')]) == [
+        (1920, 1080, 'u1'), (640, 480, 'u2')
+    ]
+
+
+def test_sizes_menu_ignores_size_links_of_other_items():
+    sidebar = f'<div class="Related"><div><a href="{RELATED}">4000×3000</a></div></div>'
+    viewed = menu((VIEWED.replace('.jpg', '_small.jpg'), '400×300'), (VIEWED, '800×600'))
+    assert parse_viewer(f'<html><body>{sidebar}{viewed}</body></html>', LINK) == [
+        (400, 300, VIEWED.replace('.jpg', '_small.jpg')), (800, 600, VIEWED)
+    ]
+    other = menu((RELATED, '4000×3000'))
+    assert largest(parse_viewer(f'<html><body>{other}{viewed}{sidebar}</body></html>', LINK)) == VIEWED
+    assert parse_viewer(sidebar, LINK) == []
@@ -0,0 +1,133 @@
+import time
+import asyncio
+import threading
+import pytest
+from scheduler import (
+    Deadline, TokenBucket, CircuitBreaker, Host, HostScheduler, Retry, HostUnavailable, DeadlineExceeded, retry_after,
+    check_status
+)
+
+
+class Response:
+    def __init__(self, status_code: int, headers: [dict, None] = None):
+        self.status_code = status_code
+        self.headers = headers or dict()
+
+
+def test_deadline():
+    assert Deadline().remaining == float('inf') and not Deadline().expired
+    assert Deadline(0).expired and Deadline(0).remaining == 0.0
+    assert 0 < Deadline(60).remaining <= 60
+
+
+def test_token_bucket_bursts_then_paces():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0 and bucket.reserve() == 0.0
+    assert not bucket.ready
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    bucket.refund()
+    assert TokenBucket(rate=0, burst=1).reserve() == 0.0
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == 'half-open' and breaker.ready
+    assert breaker.allow() and not breaker.allow()  # A single trial.
+    breaker.failure()
+    assert breaker.state == 'open' and breaker.wait == pytest.approx(0.1)
+    time.sleep(0.11)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed' and breaker.wait == 0.05
+
+
+def test_status_helpers():
+    assert retry_after({'Retry-After': '3'}) == 3.0
+    assert retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) is None
+    with pytest.raises(Retry) as caught:
+        check_status(Response(429, {'Retry-After': '2'}))
+    assert caught.value.after == 2.0
+    response = Response(404)
+    assert check_status(response) is response
+
+
+def test_threads_and_coroutines_share_the_limit():
+    host = Host('example.com', rate=0, burst=1, limit=1, threshold=5, cooldown=1)
+    assert host.acquire(0)
+
+    async def blocked() -> bool:
+        return await host.acquire_async(0.05)
+
+    assert asyncio.run(blocked()) is False
+    assert host.active == 1
+    host.release()
+
+    async def hold() -> bool:
+        taken = await host.acquire_async(1)
+        assert not host.acquire(0)
+        host.release()
+        return taken
+
+    assert asyncio.run(hold()) is True  # A second event loop, nothing is bound to the first.
+    assert host.active == 0 and host.waiters == []
+
+
+def test_release_from_a_thread_wakes_a_coroutine():
+    host = Host('example.com', rate=0, burst=1, limit=1, threshold=5, cooldown=1)
+    assert host.acquire(0)
+    timer = threading.Timer(0.05, host.release)
+
+    async def wait() -> bool:
+        timer.start()
+        return await host.acquire_async(5)
+
+    start = time.monotonic()
+    assert asyncio.run(wait()) is True
+    assert time.monotonic() - start < 1
+    host.release()
+
+
+def test_run_retries_then_gives_up():
+    scheduler = HostScheduler(rate=0, attempts=3, backoff_base=0.001, backoff_cap=0.01)
+    calls = list()
+
+    def flaky() -> str:
+        calls.append(1)
+        if len(calls) < 3:
+            raise Retry('busy')
+        return 'ok'
+
+    assert scheduler.run('https://example.com/a', flaky) == 'ok'
+    assert len(calls) == 3
+    with pytest.raises(Retry):
+        scheduler.run('https://example.com/a', lambda: check_status(Response(503)))
+
+
+def test_run_respects_open_circuit_and_deadline():
+    scheduler = HostScheduler(rate=0, attempts=1, threshold=1, cooldown=60)
+    with pytest.raises(Retry):
+        scheduler.run('https://down.example.com/', lambda: check_status(Response(500)))
+    with pytest.raises(HostUnavailable):
+        scheduler.run('https://down.example.com/', lambda: 'never')
+    assert scheduler.states()['down.example.com'] == 'open'
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run('https://up.example.com/', lambda: 'never', deadline=Deadline(0))
+
+
+def test_run_async():
+    scheduler = HostScheduler(rate=0, attempts=2, backoff_base=0.001, backoff_cap=0.01)
+    calls = list()
+
+    async def flaky() -> str:
+        calls.append(1)
+        if len(calls) < 2:
+            raise Retry('busy')
+        return 'ok'
+
+    assert asyncio.run(scheduler.run_async('https://example.com/', flaky)) == 'ok'
+    assert scheduler.host('https://example.com/').active == 0
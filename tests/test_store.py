@@ -0,0 +1,63 @@
+import hashlib
+import numpy as np
+from PIL import Image
+from store import Manifest, content_name, MANIFEST_NAME
+
+
+def test_content_name():
+    assert content_name('abc', 'jpeg') == 'abc.jpg'
+    assert content_name('abc', 'webp') == 'abc.webp'
+    assert content_name('abc', 'gif') == 'abc.png'
+
+
+def test_manifest_records_and_finds(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    try:
+        manifest.add('a.png', 'https://example.com/a.png', 'digest-a', 10, 20, 0xABC)
+        assert 'a.png' in manifest and len(manifest) == 1
+        assert manifest.find_url('https://example.com/a.png') == 'a.png'
+        assert manifest.find_digest('digest-a') == 'a.png'
+        assert manifest.find_url('https://example.com/b.png') is None
+        assert manifest.names() == ['a.png']
+        manifest.remove('a.png')
+        assert manifest.names() == [] and manifest.find_digest('digest-a') is None
+    finally:
+        manifest.close()
+
+
+def test_claims_are_exclusive_until_released(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    try:
+        assert manifest.claim('key')
+        assert not manifest.claim('key')
+        manifest.release('key', 'unknown')
+        assert manifest.claim('key')
+    finally:
+        manifest.close()
+
+
+def test_load_adopts_images_and_drops_missing_ones(tmp_path):
+    Image.fromarray(np.zeros((8, 12, 3), dtype=np.uint8)).save(tmp_path / 'old.png')
+    (tmp_path / 'notes.txt').write_text('not an image')
+    manifest = Manifest(str(tmp_path))
+    assert manifest.names() == ['old.png']
+    manifest.close()
+    assert (tmp_path / MANIFEST_NAME).is_file()
+    (tmp_path / 'old.png').unlink()
+    manifest = Manifest(str(tmp_path))
+    try:
+        assert manifest.names() == []
+    finally:
+        manifest.close()
+
+
+def test_load_records_images_added_later(tmp_path):
+    Image.fromarray(np.zeros((8, 12, 3), dtype=np.uint8)).save(tmp_path / 'old.png')
+    Manifest(str(tmp_path)).close()
+    Image.fromarray(np.full((6, 10, 3), 255, dtype=np.uint8)).save(tmp_path / 'new.png')
+    manifest = Manifest(str(tmp_path))
+    try:
+        assert manifest.names() == ['new.png', 'old.png']
+        assert manifest.find_digest(hashlib.md5((tmp_path / 'new.png').read_bytes()).hexdigest()) == 'new.png'
+    finally:
+        manifest.close()